@@ -0,0 +1,69 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Any, Optional
+from datetime import datetime, timedelta
+
+from app.core.database import get_async_db
+from app.api.auth.routes import get_current_user, is_admin
+from app.services.analytics_rollup import naive_utc, query_rollups, session_rollup
+
+router = APIRouter()
+
+
+def _check_access(current_user, user_id: Optional[int]):
+    """只能查询自己的数据，管理员可以查询任意用户"""
+    if user_id != current_user.id and not is_admin(current_user):
+        raise HTTPException(status_code=403, detail="Not authorized to access this user's analytics")
+
+
+@router.get("/head-up-rate")
+async def head_up_rate_series(
+    granularity: str = Query("minute", description="聚合粒度: minute/hour"),
+    start: Optional[datetime] = Query(None, description="起始时间（默认为结束时间前24小时）"),
+    end: Optional[datetime] = Query(None, description="结束时间（不含，默认为当前时间）"),
+    user_id: Optional[int] = Query(None, description="用户ID（默认为当前用户）"),
+    current_user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+) -> Dict[str, Any]:
+    """按分钟/小时返回时间范围内的抬头率（从聚合表查询，不扫描逐帧记录）"""
+    if user_id is None:
+        user_id = current_user.id
+    _check_access(current_user, user_id)
+
+    end = naive_utc(end) if end is not None else datetime.utcnow()
+    start = naive_utc(start) if start is not None else end - timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be earlier than end")
+
+    try:
+        buckets = await query_rollups(db, user_id, granularity, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    frame_count = sum(bucket["frame_count"] for bucket in buckets)
+    return {
+        "user_id": user_id,
+        "granularity": granularity,
+        "start": start,
+        "end": end,
+        "frame_count": frame_count,
+        "head_up_rate": (
+            sum(bucket["head_up_rate"] * bucket["frame_count"] for bucket in buckets) / frame_count
+            if frame_count else 0
+        ),
+        "buckets": buckets
+    }
+
+
+@router.get("/sessions/{session_id}")
+async def session_summary(
+    session_id: int,
+    current_user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+) -> Dict[str, Any]:
+    """会话的聚合抬头率"""
+    summary = await session_rollup(db, session_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    _check_access(current_user, summary["user_id"])
+    return summary
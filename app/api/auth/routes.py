@@ -1,15 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, status,Form,Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
+import logging
 from jose import JWTError, jwt
 from pydantic import BaseModel, EmailStr
 
-from app.core.database import get_db
+from app.core.database import get_async_db
 from app.core.config import settings
-from app.services.auth import authenticate_user, create_access_token, get_password_hash,authenticate_user_by_email
+from app.services.auth import authenticate_user, create_access_token, hash_password,authenticate_user_by_email
+from app.services.auth import UserSnapshot, token_cache
 from app.models.user import User
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 public_router = APIRouter() # 公共路由，不需要身份验证
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/public/login")
@@ -20,17 +25,14 @@ class UserCreate(BaseModel):
     password: str
     email: EmailStr
 
-# 添加用户身份验证函数
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> User:
-    """从token中获取当前用户"""
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="无效的身份认证凭据",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+async def user_from_token(token: str, db: AsyncSession) -> Optional[UserSnapshot]:
+    """解码JWT token并从数据库获取用户，token无效或用户不存在时返回None
+
+    结果按token缓存，缓存有效期内不再解码token和查询数据库。
+    """
+    user = token_cache.get(token)
+    if user is not None:
+        return user
     try:
         # 解码JWT token
         payload = jwt.decode(
@@ -38,48 +40,77 @@ async def get_current_user(
             settings.SECRET_KEY,
             algorithms=[settings.ALGORITHM]
         )
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
+        return None
+    username: str = payload.get("sub")
+    if username is None:
+        return None
 
     # 从数据库获取用户
-    user = db.query(User).filter(User.username == username).first()
+    user = (await db.execute(select(User).where(User.username == username))).scalars().first()
+    if user is None:
+        return None
+    user = UserSnapshot.from_user(user)
+    token_cache.set(token, payload, user)
+    return user
+
+# 添加用户身份验证函数
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+) -> UserSnapshot:
+    """从token中获取当前用户"""
+    user = await user_from_token(token, db)
     if user is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="无效的身份认证凭据",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
 
+def is_admin(user: UserSnapshot) -> bool:
+    """用户名在ADMIN_USERNAMES中的用户是管理员"""
+    return user.username in settings.ADMIN_USERNAMES
+
+async def get_current_admin(current_user: UserSnapshot = Depends(get_current_user)) -> UserSnapshot:
+    """要求当前用户是管理员"""
+    if not is_admin(current_user):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="需要管理员权限"
+        )
+    return current_user
+
 @public_router.post("/register")
 async def register(
     username: str = Form(...),
     password: str = Form(...),
     email: EmailStr = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     #emial会自动验证格式，如果格式不正确会抛出ValidationError
     # 检查用户是否已存在
-    db_user = db.query(User).filter(User.username == username).first()
+    db_user = (await db.execute(select(User).where(User.username == username))).scalars().first()
     if db_user:
         raise HTTPException(status_code=400, detail="用户名已存在")
     
     # 创建新用户
-    hashed_password = get_password_hash(password)
+    hashed_password = await hash_password(password)
     db_user = User(
         username=username,
         email=email,
         hashed_password=hashed_password
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
     
     return {"message": "注册成功"}
 
 @public_router.post("/login")
 async def login(
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     form_data = await request.form()
     email = form_data.get("email")
@@ -95,7 +126,7 @@ async def login(
         )
     
     access_token = create_access_token(data={"sub": user.username})
-    print("token:", access_token)
+    logger.debug("用户登录: %s", user.username)
     # 返回token和用户名
     username = user.username
     return {"access_token": access_token, "token_type": "bearer","username": username}
@@ -116,19 +147,20 @@ class PasswordResetRequest(BaseModel):
 async def forgot_password(
     email: EmailStr = Form(...),
     password_new: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # 检查用户是否存在
-    user = db.query(User).filter(User.email == email).first()
+    user = (await db.execute(select(User).where(User.email == email))).scalars().first()
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
     
     # 更新密码
-    print("新密码:", password_new)
-    hashed_password = get_password_hash(password_new)
+    logger.info("重置密码: %s", user.username)
+    hashed_password = await hash_password(password_new)
     user.hashed_password = hashed_password
     
-    # 提交更改到数据库
-    db.commit()
+    # 提交更改到数据库，该用户已缓存的token需重新校验
+    await db.commit()
+    token_cache.invalidate_user(user.username)
     
     return {"message": "密码已成功重置"}
\ No newline at end of file
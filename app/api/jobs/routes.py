@@ -0,0 +1,50 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Dict, Any, Optional
+import json
+
+from app.services.detections import format_result, normalize_format
+from app.services.job_service import job_manager
+
+router = APIRouter()
+
+def _detection_format(detection_format: Optional[str]) -> str:
+    try:
+        return normalize_format(detection_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _format_job(job: Dict[str, Any], detection_format: str) -> Dict[str, Any]:
+    """按请求指定的格式输出任务结果中的检测结果"""
+    if job["result"] is not None:
+        format_result(job["result"], detection_format)
+    return job
+
+@router.get("/{job_id}")
+async def get_job(
+    job_id: str,
+    detection_format: Optional[str] = Query(None, description="检测结果格式: list/compact")
+) -> Dict[str, Any]:
+    """查询视频分析任务的状态、进度和结果"""
+    detection_format = _detection_format(detection_format)
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _format_job(job, detection_format)
+
+@router.get("/{job_id}/events")
+async def stream_job_events(
+    job_id: str,
+    detection_format: Optional[str] = Query(None, description="检测结果格式: list/compact")
+):
+    """以Server-Sent Events推送任务进度，任务结束后推送最终结果并关闭"""
+    detection_format = _detection_format(detection_format)
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        async for job in job_manager.events(job_id):
+            yield f"data: {json.dumps(_format_job(job, detection_format))}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
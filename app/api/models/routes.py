@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from pydantic import BaseModel
+from typing import Dict, Any, Optional
+
+from app.api.auth.routes import get_current_admin
+from app.services.model_registry import model_registry
+
+router = APIRouter(dependencies=[Depends(get_current_admin)])
+
+# 模型切换请求：只给出name时切换到已注册的模型，给出model_path时先按该权重注册（新版本）再切换
+class ModelSwap(BaseModel):
+    name: str
+    kind: str = "yolov8"
+    model_path: Optional[str] = None
+    version: Optional[str] = None
+
+@router.get("")
+async def list_models() -> Dict[str, Any]:
+    """已注册的模型、当前激活的模型和切换状态"""
+    return model_registry.status()
+
+@router.post("/swap", status_code=status.HTTP_202_ACCEPTED)
+async def swap_model(swap: ModelSwap) -> Dict[str, Any]:
+    """在后台加载并预热指定模型，就绪后切换流量（通过 GET /api/models 查询进度）"""
+    try:
+        if swap.model_path is not None:
+            await model_registry.register(swap.name, swap.kind, swap.model_path, swap.version)
+        return model_registry.swap(swap.name)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.delete("/{name}")
+async def unload_model(name: str) -> Dict[str, Any]:
+    """卸载非激活的模型"""
+    try:
+        await model_registry.unload(name)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return model_registry.status()
@@ -1,158 +1,423 @@
-from fastapi import APIRouter, WebSocket, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, BackgroundTasks, WebSocket, WebSocketDisconnect, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
-from typing import Dict, List, Any
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from datetime import datetime
 from pathlib import Path
-import shutil
+import asyncio
+import base64
+import json
+import logging
+import time
+import uuid
 import cv2
 import numpy as np
 from app.core.config import settings
-from app.services.yolo_service_new import yolo_service
-from app.core.database import get_db
-from app.models.video import VideoSession, VideoAnalysis
-from sqlalchemy.orm import Session
-from app.api.auth.routes import get_current_user
+from app.services.model_registry import model_registry
+from app.services.visualization import normalize_mode, render_detections, save_visualization
+from app.services.tracker import KeyframeTracker
+from app.services.frame_diff import MotionGate
+from app.services.frame_sampler import SamplingPolicy
+from app.services.detections import convert_detections, format_result, max_confidence, normalize_format
+from app.services.upload import receive_upload, UPLOAD_OPENAPI
+from app.services.image_upload import process_uploaded_image
+from app.services.metrics import (
+    ACTIVE_STREAMS, STREAM_FRAMES_DROPPED, STREAM_FRAMES_RECEIVED, STREAM_QUEUE_DEPTH, observe_stage, stage_timer
+)
+from app.services.analytics_writer import analytics_writer
+from app.services.analytics_rollup import naive_utc
+from app.core.database import get_async_db, AsyncSessionLocal
+from app.models.video import VideoSession
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api.auth.routes import get_current_user, is_admin, user_from_token
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 @router.websocket("/stream")
 async def video_stream(websocket: WebSocket):
-    """处理实时视频流"""
+    """处理实时视频流
+
+    接收与处理解耦：接收任务把帧放入有界队列（队满时丢弃最旧的帧），
+    处理任务总是处理最新的帧，端到端延迟不会随摄像头发送速率累积。
+    开启跟踪（?tracking=true&keyframe_interval=K）时只对关键帧完整推理，
+    中间帧沿用跟踪器的检测框，结果中附带每个学生的跟踪ID和抬头率。
+    未开启跟踪时可开启帧差门控（?motion_gate=true），画面基本不变时复用上一次的结果（cached=True）。
+    每个连接创建一条视频会话（?token=<JWT> 时关联到该用户），逐帧分析记录经后写队列批量入库，
+    断开时更新会话的时长和平均抬头率。
+    """
     await websocket.accept()
+
+    # 可视化模式和检测结果格式按连接设置：/api/video/stream?visualization=none|thumbnail|full&detection_format=list|compact
     try:
-        # 创建新的视频会话
-        session_start = datetime.utcnow()
-        session_id = None  # TODO: 保存会话ID到数据库
-        
-        total_head_up_rate = 0
-        frame_count = 0
-        
+        visualization = normalize_mode(websocket.query_params.get("visualization"))
+        detection_format = normalize_format(websocket.query_params.get("detection_format"))
+        tracker = _create_tracker(
+            websocket.query_params.get("tracking"),
+            websocket.query_params.get("keyframe_interval")
+        )
+        gate = None
+        if tracker is None and _flag(websocket.query_params.get("motion_gate"), settings.MOTION_GATE_ENABLED):
+            gate = MotionGate()
+        user_id = await _stream_user_id(websocket.query_params.get("token"))
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+
+    # 创建新的视频会话
+    session_id = await analytics_writer.open_session(user_id)
+    ACTIVE_STREAMS.inc()
+
+    frame_queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, settings.STREAM_QUEUE_SIZE))
+    received_frames = 0
+    dropped_frames = 0
+    total_head_up_rate = 0
+    frame_count = 0
+
+    async def receive_frames():
+        """接收视频帧数据，队列已满时丢弃最旧的帧"""
+        nonlocal received_frames, dropped_frames
         while True:
-            # 接收视频帧数据
             frame_data = await websocket.receive_bytes()
-            
-            # 将字节数据转换为OpenCV格式
-            nparr = np.frombuffer(frame_data, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            # 处理视频帧
-            result = await yolo_service.process_frame(frame)
-            
-            # 更新统计信息
+            received_frames += 1
+            STREAM_FRAMES_RECEIVED.inc()
+            if frame_queue.full():
+                frame_queue.get_nowait()
+                dropped_frames += 1
+                STREAM_FRAMES_DROPPED.inc()
+                STREAM_QUEUE_DEPTH.dec()
+            frame_queue.put_nowait((frame_data, time.perf_counter()))
+            STREAM_QUEUE_DEPTH.inc()
+
+    async def process_frames():
+        """处理队列中的帧并返回检测结果"""
+        nonlocal total_head_up_rate, frame_count
+        while True:
+            frame_data, received_at = await frame_queue.get()
+            STREAM_QUEUE_DEPTH.dec()
+            # 帧到达后等待处理的时间
+            observe_stage("receive", time.perf_counter() - received_at)
+
+            # 处理视频帧：跟踪模式下非关键帧跳过推理，沿用上一关键帧的检测框
+            if gate is None and tracker is None:
+                # 直接提交未解码的字节，解码在推理执行器中进行，无法解码的帧返回None
+                result = await model_registry.active.process_frame(frame_data, visualization)
+                if result is None:
+                    continue
+            else:
+                # 解码和帧差比较（缩小全尺寸帧）在线程中进行，不占用事件循环
+                compare = gate.check if gate is not None else tracker.needs_inference
+                frame, compared = await asyncio.to_thread(_decode_and_compare, frame_data, compare)
+                if frame is None:
+                    continue
+                if gate is not None:
+                    result = compared
+                    if result is None:
+                        result = gate.update(await model_registry.active.process_frame(frame, visualization))
+                    else:
+                        result["timestamp"] = datetime.now().timestamp()
+                elif compared:
+                    result = tracker.observe(await model_registry.active.process_frame(frame, visualization))
+                else:
+                    result = tracker.carry()
+                    result["visualization"] = await asyncio.to_thread(
+                        render_detections, frame, tracker.detections, visualization, tracker.track_ids
+                    )
+
+            # 更新统计信息，分析记录进入后写队列，不在帧处理路径上访问数据库
             total_head_up_rate += result["head_up_rate"]
             frame_count += 1
-            
-            # 返回检测结果
-            await websocket.send_json({
+            analytics_writer.record(
+                user_id, result["head_up_rate"], max_confidence(result["detections"]), session_id
+            )
+
+            # 返回检测结果，可视化图像紧随其后作为二进制消息发送（JPEG）
+            image = result["visualization"]
+            message = {
+                "session_id": session_id,
                 "timestamp": result["timestamp"],
-                "detections": result["detections"],
+                "detections": convert_detections(result["detections"], detection_format),
                 "head_up_rate": result["head_up_rate"],
-                "visualization": result["visualization"],  # 可视化图像的Base64编码
-                "average_head_up_rate": total_head_up_rate / frame_count if frame_count > 0 else 0
-            })
-            
+                "effective_imgsz": result["effective_imgsz"],  # 实际使用的推理输入尺寸（负载过高时降低）
+                "has_visualization": image is not None,  # 为True时下一条消息是可视化图像
+                "average_head_up_rate": total_head_up_rate / frame_count if frame_count > 0 else 0,
+                "received_frames": received_frames,
+                "dropped_frames": dropped_frames,  # 因处理跟不上而被丢弃的帧数
+                "queued_frames": frame_queue.qsize()
+            }
+            if gate is not None:
+                message["cached"] = result["cached"]  # 为True时复用了上一次的检测结果
+            if tracker is not None:
+                message["keyframe"] = result["keyframe"]
+                message["track_ids"] = result["track_ids"]
+                if result["keyframe"]:
+                    # 每个学生的抬头率只在关键帧更新和发送
+                    message["student_head_up_rates"] = result["student_head_up_rates"]
+            with stage_timer("send"):
+                await websocket.send_json(message)
+                if image is not None:
+                    await websocket.send_bytes(image)
+
+    tasks = [
+        asyncio.create_task(receive_frames()),
+        asyncio.create_task(process_frames())
+    ]
+    try:
+        # 任一任务结束（客户端断开或处理出错）即结束整个会话
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            error = task.exception()
+            if error is not None and not isinstance(error, WebSocketDisconnect):
+                logger.error("Error in video stream: %s", error)
     except Exception as e:
-        print(f"Error in video stream: {e}")
+        logger.error("Error in video stream: %s", e)
     finally:
-        # 保存会话数据
-        if session_id:
-            session_end = datetime.utcnow()
-            session_duration = (session_end - session_start).total_seconds()
-            average_head_up_rate = total_head_up_rate / frame_count if frame_count > 0 else 0
-            # TODO: 更新数据库中的会话信息
-        await websocket.close()
+        for task in tasks:
+            task.cancel()
+        ACTIVE_STREAMS.dec()
+        STREAM_QUEUE_DEPTH.dec(frame_queue.qsize())
+
+        # 保存会话数据（连接处理本身被取消时也要完成写入）
+        try:
+            await asyncio.shield(analytics_writer.close_session(session_id, frame_count, total_head_up_rate))
+        except Exception as e:
+            logger.error("Error saving video session: %s", e)
+        await asyncio.wait(tasks)
+        try:
+            await websocket.close()
+        except RuntimeError:
+            # 客户端已断开，连接已关闭
+            pass
 
 
-@router.post("/upload/image")
+def _decode_and_compare(
+    frame_data: bytes,
+    compare: Callable[[np.ndarray], Any]
+) -> Tuple[Optional[np.ndarray], Any]:
+    """解码帧并与之前的帧比较（在线程中运行），返回 (帧, 比较结果)，无法解码时帧为None"""
+    with stage_timer("imdecode"):
+        frame = cv2.imdecode(np.frombuffer(frame_data, np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        return None, None
+    return frame, compare(frame)
+
+
+def _flag(value: Optional[str], default: bool) -> bool:
+    """解析布尔型查询参数"""
+    if value is None:
+        return default
+    return value.lower() in ("1", "true", "yes")
+
+
+async def _stream_user_id(token: Optional[str]) -> Optional[int]:
+    """按连接参数中的token识别用户，未提供token时返回None"""
+    if token is None:
+        return None
+
+    async with AsyncSessionLocal() as db:
+        user = await user_from_token(token, db)
+    if user is None:
+        raise ValueError("Invalid token")
+    return user.id
+
+
+def _create_tracker(tracking: Optional[str], keyframe_interval: Optional[str]) -> Optional[KeyframeTracker]:
+    """按连接参数创建关键帧跟踪器，未开启跟踪时返回None"""
+    if not _flag(tracking, settings.TRACKING_ENABLED):
+        return None
+    if keyframe_interval is None:
+        return KeyframeTracker()
+    if not keyframe_interval.isdigit() or int(keyframe_interval) < 1:
+        raise ValueError(f"Invalid keyframe interval: {keyframe_interval}")
+    return KeyframeTracker(interval=int(keyframe_interval))
+
+
+@router.post("/upload/image", openapi_extra=UPLOAD_OPENAPI)
 async def upload_image(
-    file: UploadFile = File(...),
-    current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    background_tasks: BackgroundTasks,
+    visualization: Optional[str] = Query(None, description="可视化模式: none/thumbnail/full"),
+    detection_format: Optional[str] = Query(None, description="检测结果格式: list/compact"),
+    current_user = Depends(get_current_user)
 ) -> Dict[str, Any]:
-    """处理上传的图片文件"""
-    # 检查文件扩展名
-    file_ext = file.filename.split('.')[-1].lower()
-    if file_ext not in ["jpg", "jpeg", "png"]:
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid file type. Supported types: jpg, jpeg, png"
-        )
-    
-    # 检查文件大小
-    file.file.seek(0, 2)
-    size = file.file.tell()
-    file.file.seek(0)
-    
-    if size > settings.MAX_UPLOAD_SIZE:
-        raise HTTPException(
-            status_code=413,
-            detail=f"File too large. Maximum size: {settings.MAX_UPLOAD_SIZE/1024/1024}MB"
-        )
+    """处理上传的图片文件
+
+    图片在内存中解码后直接推理，原图在响应发送后由后台任务写入磁盘，不在请求路径上读写文件。
+    """
+    try:
+        visualization = normalize_mode(visualization)
+        detection_format = normalize_format(detection_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    # 创建用户专属的图片保存目录
+    # 用户专属的图片保存目录
     user_image_dir = settings.UPLOAD_DIR / str(current_user.id) / "images"
-    user_image_dir.mkdir(exist_ok=True, parents=True)
     
+    # 流式接收图片到内存，同时校验类型、大小并计算哈希
+    upload = await receive_upload(
+        request,
+        destination=lambda filename: None,
+        allowed_extensions=["jpg", "jpeg", "png"]
+    )
     # 生成唯一文件名
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    unique_filename = f"{timestamp}_{file.filename}"
+    unique_filename = f"{timestamp}_{upload.filename}"
     file_path = user_image_dir / unique_filename
     
     try:
-        # 保存图片文件
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # 处理图片
-        result = await yolo_service.process_image(file_path)
-        
-        if result["status"] == "success":
-            # 保存分析结果
-            analysis = VideoAnalysis(
-                user_id=current_user.id,
-                timestamp=datetime.utcnow(),
-                tilt_up_rate=result["head_up_rate"],
-                is_attentive=result["head_up_rate"] > 0.5,  # 可根据需求调整阈值
-                confidence=max([det["confidence"] for det in result["detections"]], default=0.0)
-            )
-            db.add(analysis)
-            db.commit()
-            
-            return {
-                "status": "success",
-                "filename": unique_filename,
-                "result": result
-            }
-            
+        # 处理图片，相同内容已处理过时直接使用缓存结果
+        result, cached = await process_uploaded_image(
+            upload, visualization, file_path, user_image_dir / "visualizations", background_tasks
+        )
     except Exception as e:
-        # 如果处理失败，删除上传的文件
-        file_path.unlink(missing_ok=True)
+        # 处理失败时响应为错误，后台任务不会执行，原图不会保存
         raise HTTPException(
             status_code=500,
             detail=f"Error processing image: {str(e)}"
         )
-    finally:
-        file.file.close()
+
+    if result["status"] != "success":
+        # 图片无法解码或推理失败，原图不会保存
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing image: {result.get('message')}"
+        )
+
+    # 保存分析结果（后写队列批量入库）
+    analytics_writer.record(
+        current_user.id, result["head_up_rate"], max_confidence(result["detections"])
+    )
+
+    return {
+        "status": "success",
+        "filename": unique_filename,
+        "result": format_result(result, detection_format),
+        "cached": cached
+    }
+
+@router.post("/upload/video/stream", openapi_extra=UPLOAD_OPENAPI)
+async def upload_video_stream(
+    request: Request,
+    format: str = Query("ndjson", description="输出格式: ndjson/sse"),
+    visualization: Optional[str] = Query("none", description="可视化模式: none/thumbnail/full"),
+    sample_mode: Optional[str] = Query(None, description="视频采样模式: seconds/frames/count"),
+    sample_value: Optional[float] = Query(None, description="每N秒/每N帧/总采样帧数"),
+    detection_format: Optional[str] = Query(None, description="检测结果格式: list/compact"),
+    current_user = Depends(get_current_user)
+):
+    """上传视频并以NDJSON或Server-Sent Events流式返回每个采样帧的分析结果
+
+    记录依次为 info、若干 frame，最后是 summary（出错时为 error）。
+    """
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="Invalid format. Supported formats: ndjson, sse")
+
+    try:
+        visualization = normalize_mode(visualization)
+        sampling = SamplingPolicy.from_params(sample_mode, sample_value)
+        detection_format = normalize_format(detection_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # 流式保存到用户专属的视频目录
+    user_video_dir = settings.UPLOAD_DIR / str(current_user.id) / "videos"
+    # 同一秒内上传同名文件时用随机后缀区分，避免覆盖其他请求正在处理的视频
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    suffix = uuid.uuid4().hex[:8]
+    upload = await receive_upload(
+        request,
+        destination=lambda filename: user_video_dir / f"{timestamp}_{suffix}_{filename}",
+        allowed_extensions=["mp4", "avi", "mov"]
+    )
+    file_path = upload.path
+
+    async def record_stream():
+        try:
+            async for record in model_registry.active.iter_video(file_path, visualization, sampling):
+                # 可视化图像单独保存，记录中只返回其地址
+                image = record.pop("visualization", None)
+                if image:
+                    record["visualization_url"] = await save_visualization(
+                        image, user_video_dir / file_path.stem / f"frame_{record['frame_number']}.jpg"
+                    )
+                yield _format_record(format_result(record, detection_format), format)
+        except Exception as e:
+            yield _format_record({"type": "error", "status": "error", "message": str(e)}, format)
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(record_stream(), media_type=media_type)
+
+
+def _format_record(record: Dict[str, Any], format: str) -> str:
+    """把一条记录编码为NDJSON行或SSE事件"""
+    data = json.dumps(record)
+    if format == "sse":
+        return f"event: {record['type']}\ndata: {data}\n\n"
+    return data + "\n"
+
+# 会话列表返回的字段
+SESSION_COLUMNS = (
+    VideoSession.id,
+    VideoSession.start_time,
+    VideoSession.end_time,
+    VideoSession.average_head_up_rate,
+    VideoSession.session_duration
+)
 
 @router.get("/sessions/{user_id}")
 async def get_user_sessions(
     user_id: int,
+    response: Response,
+    cursor: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 中的游标"),
+    limit: int = Query(50, ge=1, le=500, description="每页会话数"),
+    start: Optional[datetime] = Query(None, description="只返回开始时间不早于该时间的会话"),
+    end: Optional[datetime] = Query(None, description="只返回开始时间早于该时间的会话"),
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> List[Dict[str, Any]]:
-    """获取用户的视频分析会话记录"""
-    if current_user.id != user_id and not current_user.is_admin:
+    """获取用户的视频分析会话记录
+
+    按开始时间从新到旧分页返回，还有更多会话时响应头 X-Next-Cursor 给出下一页的游标。
+    按 (start_time, id) 游标定位，只查询需要的列，耗时与用户的历史会话数无关。
+    """
+    if current_user.id != user_id and not is_admin(current_user):
         raise HTTPException(
             status_code=403,
             detail="Not authorized to access this user's sessions"
         )
-    
-    sessions = db.query(VideoSession).filter(VideoSession.user_id == user_id).all()
-    return [{
-        "id": session.id,
-        "start_time": session.start_time,
-        "end_time": session.end_time,
-        "average_head_up_rate": session.average_head_up_rate,
-        "session_duration": session.session_duration
-    } for session in sessions]
+
+    query = select(*SESSION_COLUMNS).where(VideoSession.user_id == user_id)
+    if start is not None:
+        query = query.where(VideoSession.start_time >= naive_utc(start))
+    if end is not None:
+        query = query.where(VideoSession.start_time < naive_utc(end))
+    if cursor is not None:
+        try:
+            after = _decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(tuple_(VideoSession.start_time, VideoSession.id) < tuple_(*after))
+    query = query.order_by(VideoSession.start_time.desc(), VideoSession.id.desc()).limit(limit + 1)
+
+    rows = (await db.execute(query)).mappings().all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1]["start_time"], rows[-1]["id"])
+    return [dict(row) for row in rows]
+
+
+def _encode_cursor(start_time: datetime, session_id: int) -> str:
+    """把最后一条会话的 (start_time, id) 编码为游标"""
+    data = json.dumps([start_time.isoformat(), session_id])
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def _decode_cursor(cursor: str):
+    try:
+        start_time, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(start_time), int(session_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
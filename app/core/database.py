@@ -1,4 +1,6 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -6,14 +8,77 @@ from app.core.config import settings
 
 SQLALCHEMY_DATABASE_URL = settings.SQLALCHEMY_DATABASE_URL
 
-# 创建数据库引擎
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# 异步引擎使用的驱动（URL未指定驱动或指定了同步驱动时替换）
+ASYNC_DRIVERS = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+}
+SYNC_DRIVERS = ("", "pysqlite", "psycopg2")
+
+
+def async_database_url(url: str) -> str:
+    """把同步数据库URL转换为对应异步驱动的URL（已指定驱动时保持不变）"""
+    url = make_url(url)
+    backend, _, driver = url.drivername.partition("+")
+    if backend in ASYNC_DRIVERS and driver in SYNC_DRIVERS:
+        url = url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+    return url.render_as_string(hide_password=False)
+
+
+def _is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _engine_options(url: str) -> dict:
+    """按数据库类型生成引擎参数：SQLite允许跨线程使用连接，文件数据库和其他数据库使用固定大小的连接池"""
+    options = {}
+    if _is_sqlite(url):
+        options["connect_args"] = {"check_same_thread": False}
+        database = make_url(url).database
+        if not database or database == ":memory:":
+            return options
+    options.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=not _is_sqlite(url),
+    )
+    return options
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """每个新连接上设置SQLite的WAL模式和性能参数"""
+    cursor = dbapi_connection.cursor()
+    if settings.SQLITE_WAL_ENABLED:
+        cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA cache_size={int(settings.SQLITE_CACHE_SIZE)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.close()
+
+
+def _configure(engine: Engine, url: str):
+    if _is_sqlite(url):
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+
+
+# 创建数据库引擎（后台线程、建表等同步场景使用）
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_options(SQLALCHEMY_DATABASE_URL))
+_configure(engine, SQLALCHEMY_DATABASE_URL)
 
 # 创建SessionLocal类
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 创建异步数据库引擎（请求处理函数中使用，不阻塞事件循环）
+ASYNC_DATABASE_URL = async_database_url(SQLALCHEMY_DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL))
+_configure(async_engine.sync_engine, ASYNC_DATABASE_URL)
+
+# 创建AsyncSessionLocal类（提交后对象属性仍可访问）
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # 创建Base类
 Base = declarative_base()
 
@@ -24,3 +89,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# 获取异步数据库会话
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,12 @@
+import logging
+
+from app.core.config import settings
+
+
+def setup_logging():
+    """按LOG_LEVEL配置应用日志，逐帧的处理日志为DEBUG级别，默认不输出"""
+    logging.basicConfig(
+        level=logging.WARNING,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    logging.getLogger("app").setLevel(settings.LOG_LEVEL.upper())
@@ -1,19 +1,45 @@
-from fastapi import FastAPI, Depends, File, UploadFile, HTTPException
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
-import shutil
+from typing import Optional
+import asyncio
+import logging
 import os
+import uuid
 
 from app.core.config import settings
-from app.core.database import engine, Base
-from app.services.yolo_service_new import yolo_service
+from app.core.logging_config import setup_logging
+from app.core.database import engine, async_engine, Base
+from app.services.model_registry import model_registry
+from app.services.inference_executor import inference_executor, segment_executor
+from app.services.auth import password_executor
+from app.services.visualization import normalize_mode
+from app.services.frame_sampler import SamplingPolicy
+from app.services.detections import format_result, normalize_format
+from app.services.result_cache import result_cache
+from app.services.adaptive_quality import quality_controller
+from app.services.analytics_writer import analytics_writer
+from app.services.upload import receive_upload, UPLOAD_OPENAPI
+from app.services.image_upload import process_uploaded_image
+from app.services.metrics import CONTENT_TYPE_LATEST, render_metrics
 from app.api.auth.routes import router as auth_router
 from app.api.auth.routes import public_router as auth_public_router
 from app.api.video.routes import router as video_router
+from app.api.jobs.routes import router as jobs_router
+from app.api.models.routes import router as models_router
+from app.api.analytics.routes import router as analytics_router
+from app.services.job_service import job_manager
 
-# 创建数据库表
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# 创建数据库表，已存在的表补建新增的索引
 Base.metadata.create_all(bind=engine)
+for table in Base.metadata.sorted_tables:
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -28,6 +54,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # 会话列表的下一页游标
 )
 
 # 创建上传目录
@@ -41,6 +68,9 @@ app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 app.include_router(auth_public_router, prefix="/api/auth/public", tags=["auth_public"])
 app.include_router(auth_router, prefix="/api/auth", tags=["auth"])
 app.include_router(video_router, prefix="/api/video", tags=["video"])
+app.include_router(jobs_router, prefix="/api/jobs", tags=["jobs"])
+app.include_router(models_router, prefix="/api/models", tags=["models"])
+app.include_router(analytics_router, prefix="/api/analytics", tags=["analytics"])
 
 # 测试连接端点
 @app.get("/api/test")
@@ -52,60 +82,115 @@ async def test_connection():
         "version": "1.0.0"
     }
 
+# 就绪检查端点（供负载均衡器轮询）
+@app.get("/api/ready")
+async def readiness_check():
+    """当前激活的模型加载并预热完成后返回200，否则返回503
+
+    ENABLE_YOLO=false 时启动时不加载模型，直接返回200（status为disabled）。
+    """
+    if not settings.ENABLE_YOLO:
+        return {"status": "disabled", "model": None}
+    yolo_service = model_registry.active
+    if yolo_service.is_ready:
+        return {"status": "ready", "model": model_registry.active_name}
+    return JSONResponse(
+        status_code=503,
+        content={
+            "status": "error" if yolo_service.load_error else "loading",
+            "detail": yolo_service.load_error
+        }
+    )
+
+# 推理结果缓存统计
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """结果缓存的命中/未命中计数"""
+    return result_cache.stats()
+
+# 自适应质量状态
+@app.get("/api/quality")
+async def quality_status():
+    """当前的推理输入尺寸、是否关闭可视化以及负载统计"""
+    return quality_controller.status()
+
+# Prometheus指标
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """各处理阶段的耗时直方图、实时流数量、待处理帧数和丢帧数等指标"""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
 # 文件上传和处理
-@app.post("/api/upload")
-async def upload_file(file: UploadFile = File(...)):
-    # 检查文件大小
-    file.file.seek(0, 2)  # 移动到文件末尾
-    file_size = file.file.tell()  # 获取文件大小
-    file.file.seek(0)  # 重置文件指针
-    
-    if file_size > settings.MAX_UPLOAD_SIZE:
-        raise HTTPException(status_code=413, detail="File too large")
-    
-    # 检查文件扩展名
-    file_ext = file.filename.split('.')[-1].lower()
-    if file_ext not in settings.ALLOWED_EXTENSIONS:
-        raise HTTPException(
-            status_code=400,
-            detail=f"File type not allowed. Allowed types: {', '.join(settings.ALLOWED_EXTENSIONS)}"
-        )
-    
-    # 创建上传目录
-    upload_dir = settings.UPLOAD_DIR
-    upload_dir.mkdir(exist_ok=True)
-    
-    # 保存文件
-    file_path = upload_dir / file.filename
+@app.post("/api/upload", openapi_extra=UPLOAD_OPENAPI)
+async def upload_file(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    visualization: Optional[str] = Query(None, description="可视化模式: none/thumbnail/full"),
+    sample_mode: Optional[str] = Query(None, description="视频采样模式: seconds/frames/count"),
+    sample_value: Optional[float] = Query(None, description="每N秒/每N帧/总采样帧数"),
+    detection_format: Optional[str] = Query(None, description="图片检测结果格式: list/compact（视频任务的结果在查询任务时指定）")
+):
     try:
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    finally:
-        file.file.close()
+        visualization = normalize_mode(visualization)
+        sampling = SamplingPolicy.from_params(sample_mode, sample_value)
+        detection_format = normalize_format(detection_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    # 处理文件（图片或视频）
-    is_video = file_ext in ['mp4', 'avi', 'mov']
+    # 流式接收文件并计算哈希，超过大小限制立即中止：
+    # 视频边接收边写盘（后台任务从磁盘读取），图片保留在内存中直接推理
+    # 文件名加唯一前缀，并发上传同名文件时互不覆盖，出错清理时也只删除本次上传的文件
+    upload_dir = settings.UPLOAD_DIR
+    upload_id = uuid.uuid4().hex
+    upload = await receive_upload(
+        request,
+        destination=lambda filename: upload_dir / f"{upload_id}_{filename}" if _is_video(filename) else None,
+        allowed_extensions=settings.ALLOWED_EXTENSIONS
+    )
+    file_path = upload_dir / f"{upload_id}_{upload.filename}"
+    content_hash = upload.sha256
+
+    # 视频交给后台任务处理，立即返回任务ID
+    if _is_video(upload.filename):
+        job_id = await job_manager.submit(
+            file_path, upload.filename, visualization=visualization, sampling=sampling,
+            content_hash=content_hash
+        )
+        return {
+            "filename": upload.filename,
+            "status": "queued",
+            "job_id": job_id,
+            "status_url": f"/api/jobs/{job_id}",
+            "events_url": f"/api/jobs/{job_id}/events",
+            "message": "Video queued for processing"
+        }
+
+    # 处理图片，相同内容已处理过时直接返回缓存结果
     try:
-        if is_video:
-            result = await yolo_service.process_video(file_path)
-        else:
-            result = await yolo_service.process_image(file_path)
-            
+        result, cached = await process_uploaded_image(
+            upload, visualization, file_path, upload_dir / "visualizations", background_tasks
+        )
+
         return {
-            "filename": file.filename,
+            "filename": upload.filename,
             "status": "success",
-            "result": result,
+            "result": format_result(result, detection_format),
+            "cached": cached,
             "message": "File processed successfully"
         }
         
     except Exception as e:
-        # 如果处理失败，删除上传的文件
-        file_path.unlink(missing_ok=True)
         raise HTTPException(
             status_code=500,
             detail=f"Error processing file: {str(e)}"
         )
 
+
+def _is_video(filename: str) -> bool:
+    return filename.split('.')[-1].lower() in ['mp4', 'avi', 'mov']
+
 # 在启动时初始化
 @app.on_event("startup")
 async def startup_event():
@@ -113,6 +198,33 @@ async def startup_event():
     # 确保必要的目录存在
     for dir_path in ["uploads/videos", "uploads/images"]:
         Path(dir_path).mkdir(parents=True, exist_ok=True)
-    
-    # TODO: 可以在这里添加其他初始化操作
-    # 比如预加载YOLO5模型等
+
+    # 后台预加载并预热模型，期间 /api/ready 返回503
+    if settings.ENABLE_YOLO:
+        app.state.warmup_task = asyncio.create_task(_warmup_model())
+
+    # 启动视频分析任务worker（包括恢复重启前未完成的任务）
+    await job_manager.start()
+
+    # 启动分析记录的后台批量写入
+    analytics_writer.start()
+
+
+async def _warmup_model():
+    """预加载并预热YOLO模型"""
+    try:
+        await model_registry.active.warmup()
+    except Exception as e:
+        logger.error("模型预热失败: %s", e)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """服务关闭时释放资源"""
+    await job_manager.stop()
+    await analytics_writer.stop()
+    await async_engine.dispose()
+    await model_registry.shutdown()
+    inference_executor.shutdown(wait=False)
+    segment_executor.shutdown(wait=False)
+    password_executor.shutdown(wait=False)
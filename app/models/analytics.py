@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, Index
+from app.core.database import Base
+
+class AnalysisRollup(Base):
+    """按分钟/小时聚合的抬头率（随逐帧分析记录的写入增量更新）"""
+    __tablename__ = "analysis_rollups"
+
+    id = Column(Integer, primary_key=True)
+    granularity = Column(String, nullable=False)  # minute/hour
+    user_id = Column(Integer, nullable=False)
+    bucket_start = Column(DateTime, nullable=False)  # 时间桶起点（UTC）
+    frame_count = Column(Integer, nullable=False, default=0)
+    head_up_sum = Column(Float, nullable=False, default=0)  # 抬头率之和，平均值 = head_up_sum / frame_count
+    attentive_count = Column(Integer, nullable=False, default=0)
+    confidence_sum = Column(Float, nullable=False, default=0)
+
+    __table_args__ = (
+        # 同时用于增量更新的冲突检测和按用户、时间范围的查询
+        Index("ux_analysis_rollups_bucket", "granularity", "user_id", "bucket_start", unique=True),
+    )
+
+class SessionRollup(Base):
+    """按会话聚合的抬头率"""
+    __tablename__ = "session_rollups"
+
+    session_id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, index=True)
+    first_timestamp = Column(DateTime)
+    last_timestamp = Column(DateTime)
+    frame_count = Column(Integer, nullable=False, default=0)
+    head_up_sum = Column(Float, nullable=False, default=0)
+    attentive_count = Column(Integer, nullable=False, default=0)
+    confidence_sum = Column(Float, nullable=False, default=0)
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+class InferenceCacheEntry(Base):
+    __tablename__ = "inference_cache"
+
+    key = Column(String, primary_key=True, index=True)  # 内容哈希+模型版本+参数的SHA-256
+    kind = Column(String)  # image/video
+    payload = Column(Text)  # JSON格式的处理结果
+    size = Column(Integer)  # payload字节数
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
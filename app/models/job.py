@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, Text, ForeignKey
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+class AnalysisJob(Base):
+    __tablename__ = "analysis_jobs"
+
+    id = Column(String, primary_key=True, index=True)  # uuid
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    filename = Column(String)
+    file_path = Column(String)
+    content_hash = Column(String)  # 文件内容SHA-256，用于结果缓存
+    visualization = Column(String)  # 可视化模式
+    sample_mode = Column(String)  # 采样策略
+    sample_value = Column(Float)
+    status = Column(String, index=True, default="queued")  # queued/running/success/error
+    frames_done = Column(Integer, default=0)
+    frames_total = Column(Integer, default=0)
+    result = Column(Text)  # JSON格式的处理结果
+    error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
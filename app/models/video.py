@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -17,6 +17,11 @@ class VideoSession(Base):
     # 关联关系
     user = relationship("User", back_populates="video_sessions")
 
+    __table_args__ = (
+        # 按用户、开始时间倒序的游标分页和日期范围过滤
+        Index("ix_video_sessions_user_start_time", "user_id", "start_time", "id"),
+    )
+
 class VideoAnalysis(Base):
     __tablename__ = "video_analysis"
 
@@ -27,3 +32,8 @@ class VideoAnalysis(Base):
     is_attentive = Column(Boolean)
     confidence = Column(Float)
     session_id = Column(Integer, index=True)  # 用于分组同一会话的分析结果
+
+    __table_args__ = (
+        # 按用户、时间范围查询原始记录
+        Index("ix_video_analysis_user_timestamp", "user_id", "timestamp"),
+    )
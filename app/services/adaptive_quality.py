@@ -0,0 +1,106 @@
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class QualityController:
+    """根据推理负载自适应调整质量
+
+    统计进行中的推理请求数（排队+执行）和推理延迟的指数滑动平均：
+    负载过高时逐级降低推理输入尺寸（如640→480→320），降到指定级别后关闭可视化；
+    负载回落后逐级恢复。两次调整之间至少间隔cooldown秒，避免来回抖动。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        base_imgsz: int = 640,
+        levels: Optional[List[int]] = None,
+        latency_high_ms: float = 200.0,
+        latency_low_ms: float = 80.0,
+        queue_high: int = 8,
+        cooldown: float = 2.0,
+        visualization_off_level: int = 1
+    ):
+        self.enabled = enabled
+        self.sizes = [base_imgsz, *(size for size in levels or [] if size < base_imgsz)]
+        self.latency_high_ms = latency_high_ms
+        self.latency_low_ms = latency_low_ms
+        self.queue_high = queue_high
+        self.cooldown = cooldown
+        self.visualization_off_level = visualization_off_level
+        self.level = 0
+        self.in_flight = 0
+        self.latency_ms = 0.0
+        self._changed_at = 0.0
+
+    @property
+    def imgsz(self) -> int:
+        """当前的推理输入尺寸"""
+        return self.sizes[self.level]
+
+    def select(self, visualization: str) -> Tuple[int, str]:
+        """返回本次推理实际使用的（输入尺寸, 可视化模式）"""
+        if not self.enabled:
+            return self.sizes[0], visualization
+        if self.level >= self.visualization_off_level:
+            visualization = "none"
+        return self.imgsz, visualization
+
+    @asynccontextmanager
+    async def track(self) -> AsyncIterator[None]:
+        """包裹一次推理调用，统计进行中的请求数和延迟"""
+        self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._observe((time.perf_counter() - start) * 1000)
+
+    def _observe(self, latency_ms: float):
+        self.latency_ms = latency_ms if self.latency_ms == 0 else 0.8 * self.latency_ms + 0.2 * latency_ms
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        if now - self._changed_at < self.cooldown:
+            return
+
+        overloaded = self.latency_ms > self.latency_high_ms or self.in_flight > self.queue_high
+        relaxed = self.latency_ms < self.latency_low_ms and self.in_flight <= self.queue_high // 2
+        if overloaded and self.level < len(self.sizes) - 1:
+            self.level += 1
+        elif relaxed and self.level > 0:
+            self.level -= 1
+        else:
+            return
+        self._changed_at = now
+        logger.info("自适应质量调整: 输入尺寸 %d，延迟 %.0fms，进行中 %d", self.imgsz, self.latency_ms, self.in_flight)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "imgsz": self.imgsz,
+            "level": self.level,
+            "visualization_enabled": self.level < self.visualization_off_level,
+            "latency_ms": round(self.latency_ms, 2),
+            "in_flight": self.in_flight
+        }
+
+
+# 创建自适应质量控制实例
+quality_controller = QualityController(
+    enabled=settings.ADAPTIVE_QUALITY_ENABLED,
+    base_imgsz=settings.INFERENCE_IMGSZ,
+    levels=settings.ADAPTIVE_IMGSZ_LEVELS,
+    latency_high_ms=settings.ADAPTIVE_LATENCY_HIGH_MS,
+    latency_low_ms=settings.ADAPTIVE_LATENCY_LOW_MS,
+    queue_high=settings.ADAPTIVE_QUEUE_HIGH,
+    cooldown=settings.ADAPTIVE_COOLDOWN,
+    visualization_off_level=settings.ADAPTIVE_VISUALIZATION_OFF_LEVEL,
+)
@@ -0,0 +1,184 @@
+import argparse
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models.analytics import AnalysisRollup, SessionRollup
+from app.models.video import VideoAnalysis
+
+# 支持的时间聚合粒度
+GRANULARITIES = ("minute", "hour")
+
+# 聚合的计数字段（增量更新时与已有值相加）
+_SUMS = ("frame_count", "head_up_sum", "attentive_count", "confidence_sum")
+
+
+def naive_utc(value: datetime) -> datetime:
+    """数据库中的时间为不带时区的UTC时间，带时区的查询参数先转换为UTC"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """时间戳所在时间桶的起点"""
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(second=0, microsecond=0)
+
+
+def _empty() -> Dict[str, Any]:
+    return {field: 0 for field in _SUMS}
+
+
+def _add(bucket: Dict[str, Any], row: Dict[str, Any]):
+    bucket["frame_count"] += 1
+    bucket["head_up_sum"] += row["tilt_up_rate"] or 0
+    bucket["attentive_count"] += 1 if row["is_attentive"] else 0
+    bucket["confidence_sum"] += row["confidence"] or 0
+
+
+def aggregate(rows: Iterable[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """把一批分析记录聚合为（时间桶增量, 会话增量）
+
+    没有用户的记录（匿名实时流）不计入时间聚合，没有会话的记录（单张图片）不计入会话聚合。
+    """
+    buckets: Dict[Tuple[str, int, datetime], Dict[str, Any]] = defaultdict(_empty)
+    sessions: Dict[int, Dict[str, Any]] = {}
+    for row in rows:
+        timestamp = row["timestamp"]
+        if row["user_id"] is not None:
+            for granularity in GRANULARITIES:
+                _add(buckets[(granularity, row["user_id"], bucket_start(timestamp, granularity))], row)
+        if row["session_id"] is not None:
+            session = sessions.get(row["session_id"])
+            if session is None:
+                session = sessions[row["session_id"]] = {
+                    **_empty(),
+                    "session_id": row["session_id"],
+                    "user_id": row["user_id"],
+                    "first_timestamp": timestamp,
+                    "last_timestamp": timestamp
+                }
+            if session["user_id"] is None:
+                session["user_id"] = row["user_id"]
+            session["first_timestamp"] = min(session["first_timestamp"], timestamp)
+            session["last_timestamp"] = max(session["last_timestamp"], timestamp)
+            _add(session, row)
+
+    time_rows = [
+        {"granularity": granularity, "user_id": user_id, "bucket_start": start, **sums}
+        for (granularity, user_id, start), sums in buckets.items()
+    ]
+    return time_rows, list(sessions.values())
+
+
+def _upsert(db: Session, model, key: List[str], rows: List[Dict[str, Any]], keep_first: Tuple[str, ...] = ()):
+    """插入聚合行，已存在时把计数字段累加到已有值上"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        stmt = postgresql.insert(model)
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(model)
+    else:
+        raise ValueError(f"Rollups are not supported on {dialect}")
+    table = model.__table__
+    updates = {field: table.c[field] + stmt.excluded[field] for field in _SUMS}
+    for column in rows[0]:
+        if column not in updates and column not in key and column not in keep_first:
+            updates[column] = stmt.excluded[column]
+    db.execute(stmt.on_conflict_do_update(index_elements=key, set_=updates), rows)
+
+
+def apply_rollups(db: Session, rows: List[Dict[str, Any]]):
+    """按一批新插入的分析记录增量更新聚合表（在调用方的事务中执行，不提交）"""
+    time_rows, session_rows = aggregate(rows)
+    if time_rows:
+        _upsert(db, AnalysisRollup, ["granularity", "user_id", "bucket_start"], time_rows)
+    if session_rows:
+        _upsert(db, SessionRollup, ["session_id"], session_rows, keep_first=("user_id", "first_timestamp"))
+
+
+def rebuild_rollups(db: Session, chunk_size: int = 10000) -> int:
+    """清空聚合表并从原始分析记录重新计算（用于已有数据），返回处理的记录数"""
+    db.execute(delete(AnalysisRollup))
+    db.execute(delete(SessionRollup))
+    columns = [getattr(VideoAnalysis, name) for name in
+               ("user_id", "session_id", "timestamp", "tilt_up_rate", "is_attentive", "confidence")]
+    query = select(*columns).where(VideoAnalysis.timestamp.is_not(None)).order_by(VideoAnalysis.id)
+    total = 0
+    for chunk in db.execute(query.execution_options(yield_per=chunk_size)).mappings().partitions():
+        apply_rollups(db, [dict(row) for row in chunk])
+        total += len(chunk)
+    db.commit()
+    return total
+
+
+def _summary(rollup) -> Dict[str, Any]:
+    count = rollup.frame_count
+    return {
+        "frame_count": count,
+        "head_up_rate": rollup.head_up_sum / count if count else 0,
+        "attentive_rate": rollup.attentive_count / count if count else 0,
+        "average_confidence": rollup.confidence_sum / count if count else 0
+    }
+
+
+async def query_rollups(
+    db: AsyncSession,
+    user_id: int,
+    granularity: str,
+    start: datetime,
+    end: datetime
+) -> List[Dict[str, Any]]:
+    """查询用户在 [start, end) 内每个时间桶的抬头率（走唯一索引的范围扫描）"""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Invalid granularity: {granularity}. Supported: {', '.join(GRANULARITIES)}")
+    query = (
+        select(AnalysisRollup)
+        .where(
+            AnalysisRollup.granularity == granularity,
+            AnalysisRollup.user_id == user_id,
+            AnalysisRollup.bucket_start >= bucket_start(start, granularity),
+            AnalysisRollup.bucket_start < end
+        )
+        .order_by(AnalysisRollup.bucket_start)
+    )
+    rollups = (await db.execute(query)).scalars().all()
+    return [{"bucket_start": rollup.bucket_start, **_summary(rollup)} for rollup in rollups]
+
+
+async def session_rollup(db: AsyncSession, session_id: int) -> Optional[Dict[str, Any]]:
+    """查询会话的聚合抬头率"""
+    rollup = await db.get(SessionRollup, session_id)
+    if rollup is None:
+        return None
+    return {
+        "session_id": rollup.session_id,
+        "user_id": rollup.user_id,
+        "first_timestamp": rollup.first_timestamp,
+        "last_timestamp": rollup.last_timestamp,
+        **_summary(rollup)
+    }
+
+
+if __name__ == "__main__":
+    # 从原始记录重建聚合表: python -m app.services.analytics_rollup
+    parser = argparse.ArgumentParser(description="从原始分析记录重建抬头率聚合表")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    import app.models.user  # noqa: F401  注册关系映射
+    from app.core.database import Base, SessionLocal, engine
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        print(f"已重建聚合表，处理记录数: {rebuild_rollups(db, args.chunk_size)}")
+    finally:
+        db.close()
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.video import VideoAnalysis, VideoSession
+from app.services.analytics_rollup import apply_rollups
+
+logger = logging.getLogger(__name__)
+
+
+class AnalyticsWriter:
+    """逐帧分析结果的后写（write-behind）队列
+
+    record只把记录追加到内存缓冲区，不访问数据库；后台任务每攒够batch_size条
+    或每隔flush_interval秒把缓冲区在一个事务中批量插入，并在同一事务中增量更新按分钟/小时/会话的聚合表。
+    缓冲区超过max_pending条（数据库持续跟不上）时丢弃最旧的记录。
+    """
+
+    def __init__(self, batch_size: int = 100, flush_interval: float = 2.0, max_pending: int = 10000):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._pending: List[Dict[str, Any]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """启动后台写入任务（重复调用无副作用）"""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务并写入缓冲区中剩余的记录"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def record(
+        self,
+        user_id: Optional[int],
+        head_up_rate: float,
+        confidence: float,
+        session_id: Optional[int] = None,
+        timestamp: Optional[datetime] = None
+    ):
+        """追加一条分析记录（不等待写入）"""
+        self._pending.append({
+            "user_id": user_id,
+            "session_id": session_id,
+            "timestamp": timestamp or datetime.utcnow(),
+            "tilt_up_rate": head_up_rate,
+            "is_attentive": head_up_rate > 0.5,  # 可根据需求调整阈值
+            "confidence": confidence
+        })
+        if len(self._pending) > self.max_pending:
+            overflow = len(self._pending) - self.max_pending
+            del self._pending[:overflow]
+            self.dropped += overflow
+        if len(self._pending) >= self.batch_size:
+            if self._task is None:
+                self.start()
+            self._wakeup.set()
+
+    async def flush(self):
+        """把缓冲区中的记录在一个事务中批量插入"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            rows, self._pending = self._pending, []
+            if not rows:
+                return
+            try:
+                await asyncio.to_thread(self._insert, rows)
+            except Exception:
+                # 写入失败时放回缓冲区，下次重试
+                self._pending[:0] = rows
+                raise
+
+    async def open_session(self, user_id: Optional[int]) -> int:
+        """创建实时流会话，返回会话ID"""
+        return await asyncio.to_thread(self._create_session, user_id)
+
+    async def close_session(self, session_id: int, frame_count: int, total_head_up_rate: float):
+        """结束会话：先写入该会话缓冲中的记录，再更新会话的结束时间、时长和平均抬头率"""
+        await self.flush()
+        average_head_up_rate = total_head_up_rate / frame_count if frame_count > 0 else 0
+        await asyncio.to_thread(self._finish_session, session_id, average_head_up_rate)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("分析记录写入失败: %s", e)
+
+    # 以下为同步数据库操作，通过asyncio.to_thread在线程中执行
+
+    def _insert(self, rows: List[Dict[str, Any]]):
+        db = SessionLocal()
+        try:
+            db.execute(insert(VideoAnalysis), rows)
+            apply_rollups(db, rows)
+            db.commit()
+        finally:
+            db.close()
+
+    def _create_session(self, user_id: Optional[int]) -> int:
+        db = SessionLocal()
+        try:
+            session = VideoSession(user_id=user_id, start_time=datetime.utcnow())
+            db.add(session)
+            db.commit()
+            return session.id
+        finally:
+            db.close()
+
+    def _finish_session(self, session_id: int, average_head_up_rate: float):
+        db = SessionLocal()
+        try:
+            session = db.get(VideoSession, session_id)
+            if session is None:
+                return
+            session.end_time = datetime.utcnow()
+            session.session_duration = (session.end_time - session.start_time).total_seconds()
+            session.average_head_up_rate = average_head_up_rate
+            db.commit()
+        finally:
+            db.close()
+
+
+# 创建分析记录写入实例
+analytics_writer = AnalyticsWriter(
+    batch_size=settings.ANALYTICS_BATCH_SIZE,
+    flush_interval=settings.ANALYTICS_FLUSH_INTERVAL,
+    max_pending=settings.ANALYTICS_MAX_PENDING,
+)
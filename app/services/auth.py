@@ -1,11 +1,117 @@
+import asyncio
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Dict, Optional, Set, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.config import settings
 from app.models.user import User
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# 轮数与BCRYPT_ROUNDS不同的哈希视为需要更新（verify_and_update返回新哈希）
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
+
+# 密码哈希使用独立的有界线程池，登录高峰时不占用推理线程，也不阻塞事件循环
+password_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password")
+
+
+class UserSnapshot:
+    """认证缓存中保存的用户信息（不含密码哈希，不依赖数据库会话）"""
+    __slots__ = ("id", "username", "email")
+
+    def __init__(self, id: int, username: str, email: str):
+        self.id = id
+        self.username = username
+        self.email = email
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserSnapshot":
+        return cls(user.id, user.username, user.email)
+
+
+class TokenCache:
+    """token到（JWT声明, 用户快照）的TTL缓存，命中时不解码token也不查询数据库
+
+    条目最多保存ttl秒且不超过token自身的过期时间，条目数超过max_entries时淘汰最久未使用的。
+    用户被修改（如重置密码）时按用户名使其所有条目失效。
+    """
+
+    def __init__(self, ttl: float = 60.0, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._tokens_by_user: Dict[str, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[UserSnapshot]:
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, claims, user = entry
+        if time.monotonic() >= expires_at:
+            self._remove(token)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return user
+
+    def set(self, token: str, claims: Dict[str, Any], user: UserSnapshot):
+        if self.ttl <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl
+        if "exp" in claims:
+            expires_at = min(expires_at, time.monotonic() + claims["exp"] - time.time())
+        self._remove(token)
+        self._entries[token] = (expires_at, claims, user)
+        self._tokens_by_user.setdefault(user.username, set()).add(token)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, username: str):
+        """使该用户的所有缓存条目失效"""
+        for token in self._tokens_by_user.pop(username, set()):
+            self._entries.pop(token, None)
+
+    def _remove(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is not None:
+            tokens = self._tokens_by_user.get(entry[2].username)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._tokens_by_user[entry[2].username]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+# 创建token缓存实例
+token_cache = TokenCache(ttl=settings.AUTH_CACHE_TTL, max_entries=settings.AUTH_CACHE_MAX_ENTRIES)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target: User):
+    """通过ORM修改或删除用户时使其缓存条目失效"""
+    token_cache.invalidate_user(target.username)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -13,6 +119,30 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+async def hash_password(password: str) -> str:
+    """在密码哈希线程池中计算哈希"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, pwd_context.hash, password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """在密码哈希线程池中校验密码，密码正确且哈希轮数已过期时同时返回新哈希"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        password_executor, pwd_context.verify_and_update, plain_password, hashed_password
+    )
+
+async def _check_password(db: AsyncSession, user: Optional[User], password: str):
+    """校验用户密码，需要时把密码哈希升级为当前配置的轮数"""
+    if not user:
+        return False
+    verified, new_hash = await verify_and_update_password(password, user.hashed_password)
+    if not verified:
+        return False
+    if new_hash is not None:
+        user.hashed_password = new_hash
+        await db.commit()
+    return user
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -24,18 +154,10 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-async def authenticate_user(db, username: str, password: str):
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        return False
-    if not verify_password(password, user.hashed_password):
-        return False
-    return user
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = (await db.execute(select(User).where(User.username == username))).scalars().first()
+    return await _check_password(db, user, password)
 
-async def authenticate_user_by_email(db, email: str, password: str):
-    user = db.query(User).filter(User.email == email).first()
-    if not user:
-        return False
-    if not verify_password(password, user.hashed_password):
-        return False
-    return user
+async def authenticate_user_by_email(db: AsyncSession, email: str, password: str):
+    user = (await db.execute(select(User).where(User.email == email))).scalars().first()
+    return await _check_password(db, user, password)
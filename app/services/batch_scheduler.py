@@ -0,0 +1,125 @@
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.inference_executor import inference_executor
+
+
+class BatchScheduler:
+    """动态微批调度器
+
+    收集所有并发会话提交的帧，在达到最大批大小或最长等待时间后
+    合并成一次批量推理，再把每一帧的结果交还给各自调用方的future。
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        max_concurrency: int = 1,
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.max_concurrency = max(1, max_concurrency)
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._inflight: set = set()
+
+    @property
+    def queue_depth(self) -> int:
+        """当前等待组批的帧数"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self):
+        """在当前事件循环中启动调度任务（重复调用无副作用）"""
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止调度任务，未完成的请求全部取消"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._queue is not None:
+            while not self._queue.empty():
+                _, future = self._queue.get_nowait()
+                future.cancel()
+
+    async def submit(self, item: Any) -> Any:
+        """提交一帧并等待其推理结果"""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[Any, asyncio.Future]]:
+        """收集一批请求：最多max_batch_size帧，首帧到达后最多等待max_wait"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                # 已到期，但仍带走队列中已就绪的帧
+                while len(batch) < self.max_batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # 调用方已断开的请求不再推理
+        return [(item, future) for item, future in batch if not future.cancelled()]
+
+    async def _run(self):
+        while True:
+            # 所有执行槽都忙时不组批，新到的帧继续排队，下一批自然变大
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            if not batch:
+                self._slots.release()
+                continue
+            task = asyncio.create_task(self._execute(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _execute(self, batch: List[Tuple[Any, asyncio.Future]]):
+        try:
+            results = await self.batch_fn([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._slots.release()
+
+
+def create_batch_scheduler(batch_fn: Callable[[List[Any]], Awaitable[List[Any]]]) -> Optional[BatchScheduler]:
+    """根据配置创建批调度器，未启用时返回None"""
+    if not settings.BATCH_INFERENCE_ENABLED:
+        return None
+    # 线程池模式下所有批次共享同一个模型实例并串行推理，同时提交多个批次只会排队等锁，
+    # 不如让等待中的帧并入下一批；进程池模式下每个工作进程各有一份模型，可以并行
+    return BatchScheduler(
+        batch_fn,
+        max_batch_size=settings.BATCH_MAX_SIZE,
+        max_wait_ms=settings.BATCH_MAX_WAIT_MS,
+        max_concurrency=inference_executor.max_workers if inference_executor.is_process else 1,
+    )
@@ -0,0 +1,133 @@
+from typing import Any, Dict, List, Mapping, Optional, Union
+
+import numpy as np
+
+from app.core.config import settings
+
+# 检测结果输出格式：list 为逐个检测框的字典列表，compact 为按列存放的数组
+DETECTION_FORMATS = ("list", "compact")
+
+# 假设类别0表示"抬头"，类别1表示"低头"
+HEAD_UP_CLASS = 0
+
+
+def normalize_format(detection_format: Optional[str]) -> str:
+    """校验检测结果格式，未指定时使用配置的默认值"""
+    if detection_format is None or detection_format == "":
+        detection_format = settings.DETECTION_FORMAT
+    detection_format = detection_format.lower()
+    if detection_format not in DETECTION_FORMATS:
+        raise ValueError(
+            f"Invalid detection format: {detection_format}. "
+            f"Supported formats: {', '.join(DETECTION_FORMATS)}"
+        )
+    return detection_format
+
+
+class Detections:
+    """单帧的列式检测结果
+
+    xyxy (N, 4)、conf (N,)、cls (N,) 三个numpy数组，从模型输出张量一次性拷贝得到，
+    避免逐个检测框访问张量（每次都会触发设备同步）和逐个创建Python对象。
+    """
+
+    def __init__(self, xyxy: np.ndarray, conf: np.ndarray, cls: np.ndarray, names: Mapping[int, str]):
+        self.xyxy = xyxy
+        self.conf = conf
+        self.cls = cls
+        self.names = names
+
+    @classmethod
+    def from_data(cls, data: np.ndarray, names: Mapping[int, str]) -> "Detections":
+        """由 (N, 6) 的 [x1, y1, x2, y2, conf, cls] 数组构造（带跟踪ID时为 (N, 7)，conf/cls 在最后两列）"""
+        data = np.asarray(data, dtype=np.float32)
+        data = data.reshape(-1, data.shape[-1])
+        return cls(data[:, :4], data[:, -2], data[:, -1].astype(np.int64), names)
+
+    @classmethod
+    def from_yolov8(cls, result) -> "Detections":
+        """解析YOLOv8单张图片的结果"""
+        return cls.from_data(result.boxes.data.cpu().numpy(), result.names)
+
+    @classmethod
+    def deserialize(cls, detections: Union[List[Dict[str, Any]], Dict[str, Any]]) -> "Detections":
+        """由序列化后的检测结果（两种格式均可）还原列式数组"""
+        if isinstance(detections, dict):
+            names = {int(class_id): name for class_id, name in detections['names'].items()}
+            return cls(
+                np.asarray(detections['xyxy'], dtype=np.float32).reshape(-1, 4),
+                np.asarray(detections['conf'], dtype=np.float32),
+                np.asarray(detections['cls'], dtype=np.int64),
+                names
+            )
+        names = {det['class']: det['class_name'] for det in detections}
+        return cls(
+            np.asarray([det['bbox'] for det in detections], dtype=np.float32).reshape(-1, 4),
+            np.asarray([det['confidence'] for det in detections], dtype=np.float32),
+            np.asarray([det['class'] for det in detections], dtype=np.int64),
+            names
+        )
+
+    def __len__(self) -> int:
+        return len(self.cls)
+
+    def head_up_rate(self) -> float:
+        """抬头率：抬头类别的检测框占比"""
+        if len(self) == 0:
+            return 0.0
+        return float(np.count_nonzero(self.cls == HEAD_UP_CLASS)) / len(self)
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """逐个检测框的字典列表（原有格式）"""
+        return [
+            {
+                'bbox': bbox,
+                'confidence': confidence,
+                'class': class_id,
+                'class_name': self.names[class_id]
+            }
+            for bbox, confidence, class_id in zip(self.xyxy.tolist(), self.conf.tolist(), self.cls.tolist())
+        ]
+
+    def to_compact(self) -> Dict[str, Any]:
+        """列式格式：坐标保留1位小数、置信度保留4位小数，names只包含出现过的类别"""
+        class_ids = self.cls.tolist()
+        return {
+            # 先转为float64再取整，避免float32的舍入误差重新变成长小数
+            'xyxy': np.round(self.xyxy.astype(np.float64), 1).tolist(),
+            'conf': np.round(self.conf.astype(np.float64), 4).tolist(),
+            'cls': class_ids,
+            'names': {str(class_id): self.names[class_id] for class_id in set(class_ids)}
+        }
+
+    def serialize(self, detection_format: Optional[str] = None) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
+        """按指定格式（默认取配置）输出"""
+        if normalize_format(detection_format) == "compact":
+            return self.to_compact()
+        return self.to_list()
+
+
+def convert_detections(
+    detections: Union[List[Dict[str, Any]], Dict[str, Any]],
+    detection_format: Optional[str] = None
+) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
+    """把序列化后的检测结果（两种格式均可）转换为指定格式，已是该格式时原样返回"""
+    if (normalize_format(detection_format) == "compact") == isinstance(detections, dict):
+        return detections
+    return Detections.deserialize(detections).serialize(detection_format)
+
+
+def format_result(result: Dict[str, Any], detection_format: Optional[str] = None) -> Dict[str, Any]:
+    """按请求指定的格式输出处理结果（图片结果或带逐帧结果的视频结果）中的检测结果"""
+    if 'detections' in result:
+        result['detections'] = convert_detections(result['detections'], detection_format)
+    for frame_result in result.get('results', []):
+        frame_result['detections'] = convert_detections(frame_result['detections'], detection_format)
+    return result
+
+
+def max_confidence(detections: Union[List[Dict[str, Any]], Dict[str, Any]]) -> float:
+    """序列化后检测结果（两种格式均可）中的最高置信度"""
+    if isinstance(detections, dict):
+        return max(detections['conf'], default=0.0)
+    return max((det['confidence'] for det in detections), default=0.0)
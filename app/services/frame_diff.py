@@ -0,0 +1,51 @@
+from typing import Any, Dict, Optional
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+
+
+def downscale_gray(frame: np.ndarray, width: Optional[int] = None) -> np.ndarray:
+    """把帧缩小为指定宽度的灰度图，用于低成本比较画面变化"""
+    width = width or settings.FRAME_DIFF_WIDTH
+    height, frame_width = frame.shape[:2]
+    if frame_width > width:
+        frame = cv2.resize(frame, (width, max(1, round(height * width / frame_width))), interpolation=cv2.INTER_AREA)
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return frame
+
+
+def diff_score(previous: Optional[np.ndarray], current: np.ndarray) -> float:
+    """两张缩小灰度图的平均绝对差（0~1），没有可比较的上一帧时返回1"""
+    if previous is None or previous.shape != current.shape:
+        return 1.0
+    return float(cv2.absdiff(previous, current).mean()) / 255.0
+
+
+class MotionGate:
+    """帧差门控：画面与上一次推理的帧相比几乎没有变化时，直接复用上一次的结果
+
+    复用的结果带有 cached=True，实际推理的结果带有 cached=False。
+    """
+
+    def __init__(self, threshold: Optional[float] = None):
+        self.threshold = settings.MOTION_GATE_THRESHOLD if threshold is None else threshold
+        self._reference: Optional[np.ndarray] = None
+        self._pending: Optional[np.ndarray] = None
+        self._result: Optional[Dict[str, Any]] = None
+
+    def check(self, frame: np.ndarray) -> Optional[Dict[str, Any]]:
+        """画面变化低于阈值时返回上一次结果的副本，否则返回None（需要推理）"""
+        self._pending = downscale_gray(frame)
+        if self._result is None or diff_score(self._reference, self._pending) > self.threshold:
+            return None
+        return {**self._result, 'cached': True}
+
+    def update(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """记录刚推理的帧及其结果，作为之后比较的基准"""
+        self._reference = self._pending
+        self._result = result
+        result['cached'] = False
+        return result
@@ -0,0 +1,95 @@
+import itertools
+import math
+from typing import Iterable, Iterator, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+
+
+class SamplingPolicy:
+    """视频采样策略
+
+    - seconds: 每隔value秒采样一帧
+    - frames: 每隔value帧采样一帧
+    - count: 在整个视频中均匀采样value帧（总帧数未知时退化为每秒一帧）
+    """
+
+    MODES = ("seconds", "frames", "count")
+
+    def __init__(self, mode: str = "seconds", value: float = 1.0):
+        if mode not in self.MODES:
+            raise ValueError(
+                f"Invalid sample mode: {mode}. Supported modes: {', '.join(self.MODES)}"
+            )
+        if value is None or not value > 0:
+            raise ValueError("Sample value must be greater than 0")
+        self.mode = mode
+        self.value = value
+
+    @classmethod
+    def from_params(cls, mode: Optional[str] = None, value: Optional[float] = None) -> "SamplingPolicy":
+        """根据请求参数构造采样策略，未指定的部分使用配置默认值"""
+        return cls(
+            mode or settings.VIDEO_SAMPLE_MODE,
+            value if value is not None else settings.VIDEO_SAMPLE_VALUE
+        )
+
+    def frame_numbers(self, frame_count: int, fps: float) -> Iterable[int]:
+        """需要采样的帧号（递增）；frame_count<=0 表示总帧数未知，返回无限序列"""
+        if self.mode == "count" and frame_count > 0:
+            count = min(int(self.value), frame_count)
+            return np.unique(np.linspace(0, frame_count - 1, count).round().astype(int)).tolist()
+
+        if self.mode == "frames":
+            step = max(1, int(self.value))
+        elif self.mode == "seconds":
+            step = max(1, round(self.value * fps))
+        else:
+            step = max(1, round(fps))
+
+        if frame_count > 0:
+            return range(0, frame_count, step)
+        return itertools.count(0, step)
+
+    def __repr__(self) -> str:
+        return f"SamplingPolicy(mode={self.mode!r}, value={self.value!r})"
+
+
+def resolve_fps(cap: cv2.VideoCapture) -> float:
+    """读取视频帧率，容器元数据缺失或异常时使用配置的默认帧率"""
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if not fps or math.isnan(fps) or fps <= 0 or fps > 1000:
+        return settings.VIDEO_DEFAULT_FPS
+    return fps
+
+
+def iter_frames(
+    cap: cv2.VideoCapture,
+    frame_numbers: Iterable[int],
+    position: int = 0
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """只解码需要的帧
+
+    相邻采样帧间隔较小时用grab()跳过中间帧（不做颜色转换和拷贝），
+    间隔超过VIDEO_SEEK_THRESHOLD时直接seek到目标帧。
+    position为解码器当前所在的帧号（新打开的视频为0）。
+    """
+    for target in frame_numbers:
+        if target < position:
+            continue
+        if target - position > settings.VIDEO_SEEK_THRESHOLD:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+            position = target
+        else:
+            while position < target:
+                if not cap.grab():
+                    return
+                position += 1
+
+        ret, frame = cap.read()
+        if not ret:
+            return
+        position += 1
+        yield target, frame
@@ -0,0 +1,43 @@
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+from fastapi import BackgroundTasks
+
+from app.core.config import settings
+from app.services.model_registry import model_registry
+from app.services.result_cache import result_cache
+from app.services.upload import UploadedFile, write_bytes
+from app.services.visualization import store_visualizations, visualization_name
+
+
+async def process_uploaded_image(
+    upload: UploadedFile,
+    visualization: str,
+    file_path: Path,
+    visualization_dir: Path,
+    background_tasks: BackgroundTasks
+) -> Tuple[Dict[str, Any], bool]:
+    """处理内存中的上传图片，返回 (结果, 是否命中缓存)
+
+    相同内容、模型和参数已处理过时直接返回缓存结果；可视化图像按缓存键命名保存到visualization_dir，
+    结果中只返回其地址；处理成功时原图在响应发送后由后台任务写入file_path。
+    """
+    yolo_service = model_registry.active
+    cache_key = result_cache.make_key(
+        upload.sha256, "image", yolo_service.model_version, visualization=visualization
+    )
+    result = await result_cache.get(cache_key)
+    cached = result is not None
+    if not cached:
+        result = await yolo_service.process_image(upload.content, visualization, image_path=file_path)
+        if result["status"] == "success":
+            await store_visualizations(result, visualization_dir, visualization_name(cache_key, result))
+            # 负载过高时降级得到的结果不缓存
+            if result["effective_imgsz"] == settings.INFERENCE_IMGSZ:
+                await result_cache.set(cache_key, "image", result)
+    result["image_path"] = str(file_path)
+
+    # 处理成功时响应发送后再保存原图，失败时不保存
+    if result["status"] == "success":
+        background_tasks.add_task(write_bytes, file_path, upload.content)
+    return result, cached
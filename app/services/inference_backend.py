@@ -0,0 +1,243 @@
+import argparse
+import json
+import logging
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 推理后端：pytorch（ultralytics原生）、onnx（onnxruntime）、openvino
+BACKENDS = ("pytorch", "onnx", "openvino")
+
+
+def normalize_backend(backend: Optional[str]) -> str:
+    """校验推理后端，未指定时使用配置的默认值"""
+    backend = (backend or settings.INFERENCE_BACKEND).lower()
+    if backend not in BACKENDS:
+        raise ValueError(
+            f"Unknown inference backend: {backend}. "
+            f"Supported backends: {', '.join(BACKENDS)}"
+        )
+    return backend
+
+
+def backend_tag(backend: Optional[str] = None, int8: Optional[bool] = None) -> str:
+    """后端标识，如 pytorch、onnx、onnx-int8（参与模型版本和结果缓存键）"""
+    backend = normalize_backend(backend)
+    int8 = settings.INFERENCE_INT8 if int8 is None else int8
+    return f"{backend}-int8" if int8 else backend
+
+
+def exported_path(weights_path: str, backend: str, int8: bool = False) -> Path:
+    """.pt权重导出为指定后端后的模型路径（与权重文件放在同一目录）"""
+    weights = Path(weights_path)
+    if backend == "pytorch":
+        return weights
+    if backend == "onnx":
+        return weights.with_name(f"{weights.stem}-int8.onnx" if int8 else f"{weights.stem}.onnx")
+    return weights.with_name(f"{weights.stem}_openvino_model")
+
+
+def _is_fresh(target: Path, weights: Path) -> bool:
+    """导出结果存在且不早于权重文件（权重更新后需要重新导出）"""
+    try:
+        return target.stat().st_mtime >= weights.stat().st_mtime
+    except OSError:
+        return False
+
+
+def prepare_yolo8_model(
+    weights_path: Optional[str] = None,
+    backend: Optional[str] = None,
+    int8: Optional[bool] = None
+) -> str:
+    """返回ultralytics YOLO可直接加载的模型路径
+
+    非pytorch后端在导出结果不存在或已过期时从.pt权重导出（动态输入尺寸和批大小）；
+    INT8为onnxruntime的动态量化，只支持onnx后端。
+    """
+    weights_path = weights_path or settings.YOLO8_MODEL_PATH
+    backend = normalize_backend(backend)
+    int8 = settings.INFERENCE_INT8 if int8 is None else int8
+    if int8 and backend != "onnx":
+        raise ValueError("INT8 quantization is only supported with the onnx backend")
+    if backend == "pytorch":
+        return weights_path
+
+    weights = Path(weights_path)
+    target = exported_path(weights_path, backend, int8)
+    if _is_fresh(target, weights):
+        return str(target)
+
+    from ultralytics import YOLO
+
+    if backend == "openvino":
+        logger.info("导出OpenVINO模型: %s", target)
+        _move(YOLO(weights_path).export(format="openvino", dynamic=True), target)
+        return str(target)
+
+    fp32 = exported_path(weights_path, "onnx")
+    if not _is_fresh(fp32, weights):
+        logger.info("导出ONNX模型: %s", fp32)
+        _move(YOLO(weights_path).export(format="onnx", dynamic=True), fp32)
+    if int8:
+        logger.info("INT8动态量化: %s", target)
+        _quantize_dynamic(fp32, target)
+    return str(target)
+
+
+def _move(exported: Any, target: Path):
+    """把导出结果移动到约定的路径（ultralytics按权重文件名生成导出路径）"""
+    exported = Path(str(exported))
+    if exported.resolve() != target.resolve():
+        exported.replace(target)
+
+
+def _quantize_dynamic(source: Path, target: Path):
+    """onnxruntime动态量化（权重INT8，激活在运行时量化），保留ultralytics需要的模型元数据"""
+    import onnx
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(str(source), str(target), weight_type=QuantType.QUInt8)
+    model = onnx.load(str(target))
+    del model.metadata_props[:]
+    model.metadata_props.extend(onnx.load(str(source), load_external_data=False).metadata_props)
+    onnx.save(model, str(target))
+
+
+def yolo5_model_path(weights_path: Optional[str] = None, backend: Optional[str] = None) -> str:
+    """YOLOv5（torch.hub）使用的模型路径：非pytorch后端需要事先用yolov5的export.py导出"""
+    weights_path = weights_path or settings.YOLO5_MODEL_PATH
+    backend = normalize_backend(backend)
+    if settings.INFERENCE_INT8:
+        raise ValueError("INT8 quantization is not supported for YOLOv5")
+    path = exported_path(weights_path, backend)
+    if not path.exists():
+        raise FileNotFoundError(
+            f"Exported model not found: {path}. "
+            f"Export it with yolov5's export.py (--include {backend})"
+        )
+    return str(path)
+
+
+# 以下为各后端的一致性检查和延迟对比：python -m app.services.inference_backend --images a.jpg b.jpg
+
+def _load_images(paths: Sequence[str], count: int, size: int) -> List[np.ndarray]:
+    images = []
+    for path in paths:
+        image = cv2.imread(path)
+        if image is None:
+            raise ValueError(f"Cannot read image: {path}")
+        images.append(image)
+    if not images:
+        # 未提供图片时使用随机图像，只能比较输出是否一致，不代表实际检测效果
+        rng = np.random.default_rng(0)
+        images = [rng.integers(0, 256, (size, size, 3), dtype=np.uint8) for _ in range(count)]
+    return images
+
+
+def _parity(reference, candidate) -> Dict[str, float]:
+    """与pytorch输出比较：同类别且IoU≥0.5的匹配比例、匹配框的平均IoU和最大置信度差"""
+    from app.services.detections import Detections
+    from app.services.tracker import iou_matrix
+
+    matched = total = 0
+    ious: List[float] = []
+    conf_diffs: List[float] = []
+    for ref_result, cand_result in zip(reference, candidate):
+        ref = Detections.from_yolov8(ref_result)
+        cand = Detections.from_yolov8(cand_result)
+        total += max(len(ref), len(cand))
+        overlap = iou_matrix(ref.xyxy, cand.xyxy) * (ref.cls[:, None] == cand.cls[None, :])
+        used = set()
+        for i in np.argsort(-ref.conf):
+            if overlap.shape[1] == 0:
+                break
+            j = int(np.argmax(overlap[i]))
+            if overlap[i, j] >= 0.5 and j not in used:
+                used.add(j)
+                matched += 1
+                ious.append(float(overlap[i, j]))
+                conf_diffs.append(abs(float(ref.conf[i]) - float(cand.conf[j])))
+    return {
+        "match_rate": matched / total if total else 1.0,
+        "mean_iou": statistics.fmean(ious) if ious else 1.0,
+        "max_conf_diff": max(conf_diffs, default=0.0)
+    }
+
+
+def compare_backends(
+    weights_path: Optional[str] = None,
+    images: Sequence[np.ndarray] = (),
+    candidates: Sequence[str] = ("onnx", "onnx-int8", "openvino"),
+    runs: int = 20,
+    imgsz: int = 640
+) -> List[Dict[str, Any]]:
+    """依次加载pytorch和各候选后端，报告与pytorch的一致性以及每张图片的推理延迟
+
+    候选后端失败时在报告中记录错误，pytorch基准失败时抛出RuntimeError。
+    """
+    from ultralytics import YOLO
+
+    weights_path = weights_path or settings.YOLO8_MODEL_PATH
+    report = []
+    reference = None
+    baseline_ms = None
+    for tag in ("pytorch", *candidates):
+        backend, _, quantized = tag.partition("-")
+        entry: Dict[str, Any] = {"backend": tag}
+        try:
+            model = YOLO(prepare_yolo8_model(weights_path, backend, quantized == "int8"), task="detect")
+            outputs = [model(image, imgsz=imgsz, verbose=False)[0] for image in images]  # 首次推理兼作预热
+            latencies = []
+            for _ in range(runs):
+                for image in images:
+                    start = time.perf_counter()
+                    model(image, imgsz=imgsz, verbose=False)
+                    latencies.append((time.perf_counter() - start) * 1000)
+        except Exception as e:
+            if tag == "pytorch":
+                # 没有pytorch基准时一致性和加速比都没有意义
+                raise RuntimeError(f"PyTorch baseline failed: {e}") from e
+            entry["error"] = str(e)
+            report.append(entry)
+            continue
+
+        entry["mean_ms"] = round(statistics.fmean(latencies), 2)
+        entry["p50_ms"] = round(statistics.median(latencies), 2)
+        if tag == "pytorch":
+            reference, baseline_ms = outputs, entry["mean_ms"]
+        else:
+            entry.update({key: round(value, 4) for key, value in _parity(reference, outputs).items()})
+        entry["speedup"] = round(baseline_ms / entry["mean_ms"], 2)
+        report.append(entry)
+    return report
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="比较各推理后端与pytorch的输出一致性和推理延迟")
+    parser.add_argument("--weights", default=settings.YOLO8_MODEL_PATH, help=".pt权重路径")
+    parser.add_argument("--images", nargs="*", default=[], help="测试图片，不提供时使用随机图像")
+    parser.add_argument("--backends", nargs="*", default=["onnx", "onnx-int8", "openvino"],
+                        help="候选后端：onnx、onnx-int8、openvino")
+    parser.add_argument("--runs", type=int, default=20, help="每张图片的计时次数")
+    parser.add_argument("--imgsz", type=int, default=640, help="推理输入尺寸")
+    args = parser.parse_args(argv)
+
+    images = _load_images(args.images, count=4, size=args.imgsz)
+    try:
+        report = compare_backends(args.weights, images, args.backends, args.runs, args.imgsz)
+    except RuntimeError as e:
+        parser.exit(1, f"{e}\n")
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
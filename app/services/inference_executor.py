@@ -0,0 +1,94 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceExecutor:
+    """推理执行器：把模型推理、绘图、编码等CPU密集型操作移出事件循环
+
+    - thread: 线程池，与主进程共享模型实例
+    - process: 进程池，每个工作进程各自加载一份模型（提交的函数必须可被pickle）
+    """
+
+    EXECUTOR_TYPES = ("thread", "process")
+
+    def __init__(self, executor_type: str = "thread", max_workers: int = 1):
+        if executor_type not in self.EXECUTOR_TYPES:
+            raise ValueError(
+                f"Unknown inference executor type: {executor_type}. "
+                f"Supported types: {', '.join(self.EXECUTOR_TYPES)}"
+            )
+        self.executor_type = executor_type
+        self.max_workers = max(1, max_workers)
+        self._executor: Optional[Executor] = None
+        self._initializer: Optional[Callable[..., Any]] = None
+        self._initargs: Tuple[Any, ...] = ()
+
+    @property
+    def is_process(self) -> bool:
+        return self.executor_type == "process"
+
+    def set_initializer(self, initializer: Callable[..., Any], *initargs: Any):
+        """设置进程池工作进程启动时执行的初始化函数（如加载并预热模型），在进程池创建前设置才生效"""
+        self._initializer = initializer
+        self._initargs = initargs
+
+    def start(self) -> Executor:
+        """创建底层线程池/进程池（重复调用无副作用）"""
+        if self._executor is None:
+            if self.is_process:
+                # 使用spawn避免fork后torch线程状态异常
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self._initializer, self._initargs),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="inference",
+                )
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """在执行器中运行同步函数并等待结果"""
+        executor = self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self, wait: bool = True):
+        """关闭执行器"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+def _init_worker(initializer: Optional[Callable[..., Any]], initargs: Tuple[Any, ...]):
+    """进程池工作进程启动时执行"""
+    if initializer is not None:
+        try:
+            initializer(*initargs)
+        except Exception as e:
+            # 初始化失败不破坏进程池，之后提交的任务会各自重试并报告错误
+            logger.exception("工作进程初始化失败: %s", e)
+
+
+# 创建执行器实例
+inference_executor = InferenceExecutor(
+    executor_type=settings.INFERENCE_EXECUTOR_TYPE,
+    max_workers=settings.INFERENCE_WORKERS,
+)
+
+# 视频分段并行处理使用的进程池（每个进程独立加载模型，按需创建）
+segment_executor = InferenceExecutor(
+    executor_type="process",
+    max_workers=settings.VIDEO_SEGMENT_WORKERS,
+)
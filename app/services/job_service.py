@@ -0,0 +1,271 @@
+import asyncio
+import json
+import logging
+import uuid
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.job import AnalysisJob
+from app.services.frame_sampler import SamplingPolicy
+from app.services.result_cache import result_cache
+from app.services.visualization import store_visualizations
+from app.services.model_registry import model_registry
+
+logger = logging.getLogger(__name__)
+
+# 任务的终止状态
+FINISHED_STATUSES = ("success", "error")
+
+
+class JobManager:
+    """视频分析后台任务管理
+
+    上传接口只负责入队并立即返回任务ID，由固定数量的worker协程依次处理视频。
+    任务状态持久化在SQLite的analysis_jobs表中，服务重启后未完成的任务会重新入队。
+    """
+
+    def __init__(self, workers: int = 1):
+        self.workers = max(1, workers)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # 运行中任务的实时进度：job_id -> (已处理帧数, 总帧数)
+        self._progress: Dict[str, Tuple[int, int]] = {}
+
+    async def start(self):
+        """启动worker并恢复重启前未完成的任务"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        for job_id in await asyncio.to_thread(self._recover_jobs):
+            self._queue.put_nowait(job_id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """停止worker，运行中的任务保持running状态，下次启动时重新处理"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(
+        self,
+        file_path: Path,
+        filename: str,
+        user_id: Optional[int] = None,
+        visualization: Optional[str] = None,
+        sampling: Optional[SamplingPolicy] = None,
+        content_hash: Optional[str] = None
+    ) -> str:
+        """创建任务并入队，返回任务ID"""
+        sampling = sampling or SamplingPolicy.from_params()
+        job_id = uuid.uuid4().hex
+        job = AnalysisJob(
+            id=job_id,
+            user_id=user_id,
+            filename=filename,
+            file_path=str(file_path),
+            content_hash=content_hash,
+            visualization=visualization,
+            sample_mode=sampling.mode,
+            sample_value=sampling.value,
+            status="queued"
+        )
+        await asyncio.to_thread(self._save, job)
+        if self._queue is None:
+            await self.start()
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """查询任务状态，运行中的任务使用内存中的最新进度"""
+        job = await asyncio.to_thread(self._load, job_id)
+        if job is None:
+            return None
+        if job_id in self._progress:
+            job["frames_done"], job["frames_total"] = self._progress[job_id]
+        return job
+
+    async def events(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """任务状态流：进度变化时产出一次，任务结束后产出最终状态并结束"""
+        last = None
+        while True:
+            job = await self.get(job_id)
+            if job is None:
+                return
+            snapshot = (job["status"], job["frames_done"], job["frames_total"])
+            if snapshot != last:
+                last = snapshot
+                yield job
+            if job["status"] in FINISHED_STATUSES:
+                return
+            await asyncio.sleep(settings.JOB_PROGRESS_INTERVAL)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run_job(job_id)
+            except Exception as e:
+                logger.exception("视频分析任务失败 %s: %s", job_id, e)
+                await asyncio.to_thread(self._finish, job_id, "error", None, str(e))
+            finally:
+                self._progress.pop(job_id, None)
+
+    async def _run_job(self, job_id: str):
+        job = await asyncio.to_thread(self._mark_running, job_id)
+        if job is None:
+            return
+
+        # 整个任务使用同一个模型，处理过程中切换模型不影响该任务
+        yolo_service = model_registry.active
+
+        # 相同内容、模型和参数的视频已处理过时直接复用结果
+        sampling = SamplingPolicy.from_params(job["sample_mode"], job["sample_value"])
+        cache_key = None
+        if job["content_hash"]:
+            cache_key = result_cache.make_key(
+                job["content_hash"], "video", yolo_service.model_version,
+                visualization=job["visualization"], sample_mode=sampling.mode, sample_value=sampling.value,
+                motion_gate=settings.MOTION_GATE_THRESHOLD if settings.MOTION_GATE_ENABLED else None
+            )
+            cached = await result_cache.get(cache_key)
+            if cached is not None:
+                await asyncio.to_thread(self._finish, job_id, "success", cached, None)
+                return
+
+        def on_progress(frames_done: int, frames_total: int):
+            # 只更新内存，由flush协程定期写入数据库
+            self._progress[job_id] = (frames_done, frames_total)
+
+        flusher = asyncio.create_task(self._flush_progress(job_id))
+        try:
+            result = await yolo_service.process_video(
+                job["file_path"],
+                job["visualization"],
+                progress=on_progress,
+                sampling=sampling
+            )
+        finally:
+            flusher.cancel()
+
+        if result.get("status") != "success":
+            # 上传时每个任务的视频使用唯一文件名，删除时不会影响其他任务
+            Path(job["file_path"]).unlink(missing_ok=True)
+            await asyncio.to_thread(self._finish, job_id, "error", None, result.get("message"))
+            return
+
+        result = await store_visualizations(result, settings.UPLOAD_DIR / "visualizations", job_id)
+        if cache_key is not None:
+            await result_cache.set(cache_key, "video", result)
+        await asyncio.to_thread(self._finish, job_id, "success", result, None)
+
+    async def _flush_progress(self, job_id: str):
+        """定期把内存中的进度写入数据库，便于其他进程查询"""
+        last = None
+        while True:
+            await asyncio.sleep(settings.JOB_PROGRESS_INTERVAL)
+            progress = self._progress.get(job_id)
+            if progress is not None and progress != last:
+                last = progress
+                await asyncio.to_thread(self._update_progress, job_id, *progress)
+
+    # 以下为同步数据库操作，通过asyncio.to_thread在线程中执行
+
+    @staticmethod
+    def _to_dict(job: AnalysisJob) -> Dict[str, Any]:
+        return {
+            "id": job.id,
+            "user_id": job.user_id,
+            "filename": job.filename,
+            "file_path": job.file_path,
+            "content_hash": job.content_hash,
+            "visualization": job.visualization,
+            "sample_mode": job.sample_mode,
+            "sample_value": job.sample_value,
+            "status": job.status,
+            "frames_done": job.frames_done or 0,
+            "frames_total": job.frames_total or 0,
+            "result": json.loads(job.result) if job.result else None,
+            "error": job.error,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "updated_at": job.updated_at.isoformat() if job.updated_at else None
+        }
+
+    def _save(self, job: AnalysisJob):
+        db = SessionLocal()
+        try:
+            db.add(job)
+            db.commit()
+        finally:
+            db.close()
+
+    def _load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            job = db.get(AnalysisJob, job_id)
+            return self._to_dict(job) if job else None
+        finally:
+            db.close()
+
+    def _recover_jobs(self) -> List[str]:
+        db = SessionLocal()
+        try:
+            jobs = (
+                db.query(AnalysisJob)
+                .filter(AnalysisJob.status.in_(["queued", "running"]))
+                .order_by(AnalysisJob.created_at)
+                .all()
+            )
+            for job in jobs:
+                job.status = "queued"
+            db.commit()
+            return [job.id for job in jobs]
+        finally:
+            db.close()
+
+    def _mark_running(self, job_id: str) -> Optional[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            job = db.get(AnalysisJob, job_id)
+            if job is None or job.status in FINISHED_STATUSES:
+                return None
+            job.status = "running"
+            job.frames_done = 0
+            db.commit()
+            return self._to_dict(job)
+        finally:
+            db.close()
+
+    def _update_progress(self, job_id: str, frames_done: int, frames_total: int):
+        db = SessionLocal()
+        try:
+            db.query(AnalysisJob).filter(AnalysisJob.id == job_id).update({
+                "frames_done": frames_done,
+                "frames_total": frames_total
+            })
+            db.commit()
+        finally:
+            db.close()
+
+    def _finish(self, job_id: str, status: str, result: Optional[Dict[str, Any]], error: Optional[str]):
+        db = SessionLocal()
+        try:
+            job = db.get(AnalysisJob, job_id)
+            if job is None:
+                return
+            job.status = status
+            job.error = error
+            if result is not None:
+                job.result = json.dumps(result)
+                total_frames = result.get("video_info", {}).get("total_frames", 0)
+                job.frames_done = total_frames
+                job.frames_total = total_frames
+            db.commit()
+        finally:
+            db.close()
+
+
+# 创建任务管理实例
+job_manager = JobManager(workers=settings.JOB_WORKERS)
@@ -0,0 +1,52 @@
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+from app.core.config import settings
+from app.services.adaptive_quality import quality_controller
+
+# 推理流水线各阶段的耗时（秒），stage为 receive（帧到达后等待处理）、imdecode、inference、
+# parse（解析检测结果和计算抬头率）、plot、encode（可视化图像JPEG编码）、send
+# 进程池推理模式下 inference/parse/plot/encode 在工作进程中执行，不计入主进程的指标
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_seconds",
+    "Latency of each inference pipeline stage",
+    ["stage"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+ACTIVE_STREAMS = Gauge("stream_active", "Number of connected live video streams")
+STREAM_QUEUE_DEPTH = Gauge("stream_queue_depth", "Frames waiting to be processed across all live streams")
+STREAM_FRAMES_RECEIVED = Counter("stream_frames_received_total", "Frames received from live streams")
+STREAM_FRAMES_DROPPED = Counter(
+    "stream_frames_dropped_total", "Frames dropped because processing could not keep up"
+)
+INFERENCE_IN_FLIGHT = Gauge("inference_in_flight", "Inference requests queued or running")
+INFERENCE_IN_FLIGHT.set_function(lambda: quality_controller.in_flight)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """记录代码块的耗时到对应阶段的直方图（METRICS_ENABLED为False时不记录）"""
+    if not settings.METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start)
+
+
+def observe_stage(stage: str, seconds: float):
+    """记录已测得的阶段耗时"""
+    if settings.METRICS_ENABLED:
+        STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+def render_metrics() -> bytes:
+    """Prometheus文本格式的全部指标"""
+    return generate_latest()
+
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.services.yolo_service import YOLO5Service, yolo_service as yolo5_service
+from app.services.yolo_service_new import YOLO8Service, yolo_service
+
+logger = logging.getLogger(__name__)
+
+# 支持的模型类型
+MODEL_KINDS = ("yolov8", "yolov5")
+
+
+class ModelRegistry:
+    """多模型注册表：按名称管理多个模型服务实例，流量只发往当前激活的模型
+
+    切换模型时先在后台加载并预热新模型，就绪后再原子地替换激活的模型名，
+    切换前已拿到旧服务实例的请求继续在旧模型上完成，不会中断；旧模型保留在内存中以便快速回滚，
+    需要释放时调用unload。
+    """
+
+    def __init__(self):
+        self._services: Dict[str, YOLO8Service] = {}
+        self._kinds: Dict[str, str] = {}
+        self._active: Optional[str] = None
+        self._swap_task: Optional[asyncio.Task] = None
+        self._swap_target: Optional[str] = None
+        self._swap_error: Optional[str] = None
+
+    @property
+    def active(self) -> YOLO8Service:
+        """当前接收流量的模型服务（每个请求取一次，请求内保持不变）"""
+        return self._services[self._active]
+
+    @property
+    def active_name(self) -> Optional[str]:
+        return self._active
+
+    def get(self, name: str) -> YOLO8Service:
+        if name not in self._services:
+            raise KeyError(f"Unknown model: {name}")
+        return self._services[name]
+
+    def add(self, name: str, kind: str, service: YOLO8Service):
+        """注册已创建的模型服务实例"""
+        if name in self._services:
+            raise ValueError(f"Model {name} is already registered")
+        self._services[name] = service
+        self._kinds[name] = kind
+
+    async def register(
+        self,
+        name: str,
+        kind: str,
+        model_path: str,
+        version: Optional[str] = None
+    ) -> YOLO8Service:
+        """按权重路径注册模型（只创建服务实例，在激活或切换时才加载）
+
+        名称已注册时（同名的新版本）先卸载旧的服务实例。
+        """
+        if kind not in MODEL_KINDS:
+            raise ValueError(f"Unknown model kind: {kind}. Supported kinds: {', '.join(MODEL_KINDS)}")
+        if not Path(model_path).exists():
+            raise ValueError(f"Model weights not found: {model_path}")
+        if name in self._services:
+            await self.unload(name)
+        if kind == "yolov5":
+            service = YOLO5Service(model_path, version)
+        else:
+            service = YOLO8Service(model_path, version)
+        self.add(name, kind, service)
+        return service
+
+    def set_active(self, name: str):
+        """直接指定激活的模型（启动时使用，不等待预热）"""
+        self.get(name)
+        self._active = name
+
+    def swap(self, name: str) -> Dict[str, Any]:
+        """在后台预热指定模型，就绪后切换流量；同一时间只允许一个切换任务"""
+        self.get(name)
+        if self._swap_task is not None and not self._swap_task.done():
+            raise RuntimeError(f"Model {self._swap_target} is already being activated")
+        if name != self._active:
+            self._swap_target = name
+            self._swap_error = None
+            self._swap_task = asyncio.create_task(self._swap(name))
+        return self.status()
+
+    async def _swap(self, name: str):
+        try:
+            await self._services[name].warmup()
+            # 单线程事件循环内的一次赋值，之后的新请求全部使用新模型
+            self._active = name
+            logger.info("模型已切换: %s", name)
+        except Exception as e:
+            self._swap_error = str(e)
+            logger.error("模型切换失败 %s: %s", name, e)
+        finally:
+            self._swap_target = None
+
+    async def unload(self, name: str):
+        """卸载非激活的模型，释放其占用的内存（进程池模式下各工作进程在处理下一个任务时释放）"""
+        service = self.get(name)
+        if name == self._active or name == self._swap_target:
+            raise ValueError(f"Model {name} is active or being activated")
+        del self._services[name]
+        del self._kinds[name]
+        await service.shutdown()
+        # 其他已注册的模型使用同一权重和版本时，工作进程中的实例仍在使用，不释放
+        shared = any(other._worker_key == service._worker_key for other in self._services.values())
+        service.release(evict_workers=not shared)
+
+    def status(self) -> Dict[str, Any]:
+        """注册表状态：激活的模型、进行中的切换和每个模型的加载情况"""
+        return {
+            "active": self._active,
+            "swap": {
+                "target": self._swap_target,
+                "state": "loading" if self._swap_target else ("error" if self._swap_error else "idle"),
+                "error": self._swap_error
+            },
+            "models": [
+                {
+                    "name": name,
+                    "kind": self._kinds[name],
+                    "model_path": service.model_path,
+                    "model_version": service.model_version,
+                    "active": name == self._active,
+                    "ready": service.is_ready,
+                    "error": service.load_error
+                }
+                for name, service in self._services.items()
+            ]
+        }
+
+    async def shutdown(self):
+        """取消进行中的切换并关闭所有模型服务"""
+        if self._swap_task is not None:
+            self._swap_task.cancel()
+            await asyncio.gather(self._swap_task, return_exceptions=True)
+        for service in self._services.values():
+            await service.shutdown()
+
+
+def _create_registry() -> ModelRegistry:
+    """默认注册YOLOv8和YOLOv5两个模型，激活ACTIVE_MODEL"""
+    registry = ModelRegistry()
+    registry.add("yolov8", "yolov8", yolo_service)
+    registry.add("yolov5", "yolov5", yolo5_service)
+    registry.set_active(settings.ACTIVE_MODEL)
+    return registry
+
+
+# 创建模型注册表实例
+model_registry = _create_registry()
@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.cache import InferenceCacheEntry
+
+
+class ResultCache:
+    """内容寻址的推理结果缓存
+
+    键由上传内容的SHA-256、模型版本、阈值和影响结果的请求参数共同决定。
+    一级缓存为按字节数淘汰的内存LRU，二级缓存为SQLite中的inference_cache表。
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, enabled: bool = True):
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(
+        content_hash: str,
+        kind: str,
+        model_version: str,
+        imgsz: Optional[int] = None,
+        **params: Any
+    ) -> str:
+        """生成缓存键
+
+        imgsz为结果实际使用的推理输入尺寸（默认为配置的基准尺寸），
+        基准尺寸也计入键中，修改INFERENCE_IMGSZ后不会命中旧尺寸的结果。
+        """
+        parts = {
+            "content": content_hash,
+            "kind": kind,
+            "model": model_version,
+            "conf": settings.CONFIDENCE_THRESHOLD,
+            "iou": settings.IOU_THRESHOLD,
+            "detection_format": settings.DETECTION_FORMAT,
+            "base_imgsz": settings.INFERENCE_IMGSZ,
+            "imgsz": imgsz or settings.INFERENCE_IMGSZ,
+            **params
+        }
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """查询缓存，依次查找内存和数据库，未命中返回None"""
+        if not self.enabled:
+            return None
+
+        payload = self._memory_get(key)
+        if payload is not None:
+            self.memory_hits += 1
+            return json.loads(payload)
+
+        payload = await asyncio.to_thread(self._db_get, key)
+        if payload is not None:
+            self.db_hits += 1
+            self._memory_set(key, payload)
+            return json.loads(payload)
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, kind: str, result: Dict[str, Any]):
+        """写入两级缓存"""
+        if not self.enabled:
+            return
+        payload = json.dumps(result)
+        self._memory_set(key, payload)
+        await asyncio.to_thread(self._db_set, key, kind, payload)
+
+    def stats(self) -> Dict[str, Any]:
+        """命中/未命中计数"""
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.db_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self._entries),
+            "memory_bytes": self._bytes,
+            "memory_max_bytes": self.max_bytes
+        }
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+            return payload
+
+    def _memory_set(self, key: str, payload: str):
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = payload
+            self._bytes += size
+            # 超出容量时淘汰最久未使用的条目
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def _db_get(self, key: str) -> Optional[str]:
+        db = SessionLocal()
+        try:
+            entry = db.get(InferenceCacheEntry, key)
+            return entry.payload if entry else None
+        finally:
+            db.close()
+
+    def _db_set(self, key: str, kind: str, payload: str):
+        db = SessionLocal()
+        try:
+            db.merge(InferenceCacheEntry(key=key, kind=kind, payload=payload, size=len(payload)))
+            db.commit()
+        finally:
+            db.close()
+
+
+# 创建缓存实例
+result_cache = ResultCache(
+    max_bytes=settings.RESULT_CACHE_MAX_BYTES,
+    enabled=settings.RESULT_CACHE_ENABLED
+)
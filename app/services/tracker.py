@@ -0,0 +1,128 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.detections import HEAD_UP_CLASS, Detections
+from app.services.frame_diff import diff_score, downscale_gray
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """两组xyxy检测框两两之间的IoU，形状为 (len(a), len(b))"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0.0)
+
+
+class IoUTracker:
+    """基于IoU贪心匹配的轻量跟踪器，为每个学生分配稳定的ID并累计其抬头率"""
+
+    def __init__(self, iou_threshold: Optional[float] = None, max_age: Optional[int] = None):
+        self.iou_threshold = settings.TRACKING_IOU_THRESHOLD if iou_threshold is None else iou_threshold
+        self.max_age = settings.TRACKING_MAX_AGE if max_age is None else max_age
+        self._next_id = 1
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._boxes = np.zeros((0, 4), dtype=np.float32)
+        self._misses = np.zeros(0, dtype=np.int64)
+        # 每个跟踪ID被观测到的次数和其中抬头的次数
+        self._seen: Dict[int, int] = {}
+        self._head_up: Dict[int, int] = {}
+
+    def update(self, detections: Detections) -> np.ndarray:
+        """用一帧的检测结果更新跟踪状态，返回与检测框一一对应的跟踪ID"""
+        ious = iou_matrix(self._boxes, detections.xyxy)
+        ids = np.zeros(len(detections), dtype=np.int64)
+        matched_tracks = np.zeros(len(self._ids), dtype=bool)
+
+        # 按IoU从高到低贪心匹配，只考虑超过阈值的候选对
+        track_idx, det_idx = np.nonzero(ious >= self.iou_threshold)
+        for k in np.argsort(-ious[track_idx, det_idx], kind="stable"):
+            t, d = track_idx[k], det_idx[k]
+            if matched_tracks[t] or ids[d]:
+                continue
+            matched_tracks[t] = True
+            ids[d] = self._ids[t]
+
+        # 未匹配的检测框作为新目标
+        for d in np.flatnonzero(ids == 0):
+            ids[d] = self._next_id
+            self._next_id += 1
+
+        # 未匹配的旧目标保留到超过max_age为止
+        misses = self._misses + 1
+        keep = ~matched_tracks & (misses <= self.max_age)
+        self._ids = np.concatenate([ids, self._ids[keep]])
+        self._boxes = np.concatenate([detections.xyxy, self._boxes[keep]])
+        self._misses = np.concatenate([np.zeros(len(ids), dtype=np.int64), misses[keep]])
+        for track_id in set(self._seen) - set(self._ids.tolist()):
+            self._seen.pop(track_id)
+            self._head_up.pop(track_id, None)
+
+        for track_id, class_id in zip(ids.tolist(), detections.cls.tolist()):
+            self._seen[track_id] = self._seen.get(track_id, 0) + 1
+            if class_id == HEAD_UP_CLASS:
+                self._head_up[track_id] = self._head_up.get(track_id, 0) + 1
+        return ids
+
+    def student_head_up_rates(self) -> Dict[str, float]:
+        """当前仍在跟踪的每个学生的抬头率（跟踪ID -> 抬头率）"""
+        return {
+            str(track_id): self._head_up.get(track_id, 0) / seen
+            for track_id, seen in self._seen.items()
+        }
+
+
+class KeyframeTracker:
+    """实时流的关键帧调度：每隔interval帧或画面变化超过阈值时完整推理，中间帧沿用上一关键帧的检测框"""
+
+    def __init__(self, interval: Optional[int] = None, scene_threshold: Optional[float] = None):
+        self.interval = max(1, settings.TRACKING_KEYFRAME_INTERVAL if interval is None else interval)
+        self.scene_threshold = settings.TRACKING_SCENE_THRESHOLD if scene_threshold is None else scene_threshold
+        self.tracker = IoUTracker()
+        self._keyframe_gray: Optional[np.ndarray] = None
+        self._pending_gray: Optional[np.ndarray] = None
+        self._since_keyframe = 0
+        self._last: Optional[Dict[str, Any]] = None
+        self.detections: Optional[Detections] = None
+        self.track_ids: List[int] = []
+
+    def needs_inference(self, frame: np.ndarray) -> bool:
+        """判断当前帧是否需要完整推理"""
+        self._pending_gray = downscale_gray(frame)
+        if self._last is None or self._since_keyframe + 1 >= self.interval:
+            return True
+        return diff_score(self._keyframe_gray, self._pending_gray) > self.scene_threshold
+
+    def observe(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """记录关键帧的推理结果，返回附加了跟踪ID和每个学生抬头率的结果"""
+        self.detections = Detections.deserialize(result['detections'])
+        self.track_ids = self.tracker.update(self.detections).tolist()
+        self._keyframe_gray = self._pending_gray
+        self._since_keyframe = 0
+        self._last = {
+            **result,
+            'keyframe': True,
+            'track_ids': self.track_ids,  # 与detections一一对应
+            'student_head_up_rates': self.tracker.student_head_up_rates()
+        }
+        return self._last
+
+    def carry(self) -> Dict[str, Any]:
+        """非关键帧：沿用上一关键帧的检测框、类别和跟踪ID"""
+        self._since_keyframe += 1
+        result = {
+            key: value for key, value in self._last.items()
+            if key not in ('visualization', 'student_head_up_rates')
+        }
+        result['keyframe'] = False
+        result['timestamp'] = datetime.now().timestamp()
+        return result
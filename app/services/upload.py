@@ -0,0 +1,218 @@
+import hashlib
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import aiofiles
+from fastapi import HTTPException, Request
+
+try:
+    import python_multipart as multipart
+    from python_multipart.exceptions import FormParserError
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:
+    import multipart
+    from multipart.exceptions import FormParserError
+    from multipart.multipart import parse_options_header
+
+from app.core.config import settings
+
+# 请求体中除文件内容外multipart边界、头部等额外开销的上限，用于Content-Length预检查
+MULTIPART_OVERHEAD = 64 * 1024
+
+# 流式上传接口不声明File参数，这里为OpenAPI文档补充请求体描述
+UPLOAD_OPENAPI: Dict[str, Any] = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"]
+                }
+            }
+        }
+    }
+}
+
+
+class UploadedFile:
+    """已接收的上传文件：path为写入磁盘的路径，content为保留在内存中的内容（二者其一）"""
+
+    def __init__(
+        self,
+        filename: str,
+        path: Optional[Path],
+        size: int,
+        sha256: str,
+        content: Optional[bytes] = None
+    ):
+        self.filename = filename
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.content = content
+
+    @property
+    def extension(self) -> str:
+        return self.filename.split('.')[-1].lower()
+
+
+class _MultipartEvents:
+    """multipart解析回调是同步的，这里只把它们记录为事件，由异步循环统一处理（写文件需要await）"""
+
+    def __init__(self):
+        self.events: List[Tuple] = []
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+
+    def callbacks(self) -> Dict[str, Callable]:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+    def drain(self) -> List[Tuple]:
+        events, self.events = self.events, []
+        return events
+
+    def on_part_begin(self):
+        self._disposition = b""
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        self.events.append(("begin", name, filename.decode("utf-8", "replace") if filename else None))
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        self.events.append(("data", data[start:end]))
+
+    def on_part_end(self):
+        self.events.append(("end",))
+
+
+def _check_extension(filename: str, allowed_extensions: List[str]):
+    file_ext = filename.split('.')[-1].lower()
+    if file_ext not in allowed_extensions:
+        raise HTTPException(
+            status_code=400,
+            detail=f"File type not allowed. Allowed types: {', '.join(allowed_extensions)}"
+        )
+
+
+def _too_large(max_size: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File too large. Maximum size: {max_size/1024/1024}MB"
+    )
+
+
+async def write_bytes(path: Path, data: bytes):
+    """异步写入文件"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    async with aiofiles.open(path, "wb") as f:
+        await f.write(data)
+
+
+async def receive_upload(
+    request: Request,
+    destination: Callable[[str], Optional[Path]],
+    allowed_extensions: List[str],
+    max_size: Optional[int] = None,
+    field_name: str = "file"
+) -> UploadedFile:
+    """流式接收multipart上传文件
+
+    边读取请求体边异步写入destination(文件名)返回的路径，同时计算SHA-256；
+    destination返回None时文件内容只保留在内存中（UploadedFile.content），不落盘。
+    文件类型在收到分段头部时即校验，大小超过max_size时立即中止（返回413）并删除已写入的部分，
+    除内存模式保留文件内容外，不会在内存或临时文件中缓存完整请求体。
+    """
+    max_size = settings.MAX_UPLOAD_SIZE if max_size is None else max_size
+
+    # Content-Length明显超限时不读取请求体直接拒绝
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_size + MULTIPART_OVERHEAD:
+        raise _too_large(max_size)
+
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise HTTPException(status_code=400, detail="Expected multipart/form-data with a boundary")
+
+    events = _MultipartEvents()
+    parser = multipart.MultipartParser(boundary, events.callbacks())
+
+    uploaded: Optional[UploadedFile] = None
+    filename: Optional[str] = None
+    path: Optional[Path] = None
+    out = None
+    buffer: Optional[bytearray] = None
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for event in events.drain():
+                if event[0] == "begin":
+                    _, name, part_filename = event
+                    if uploaded is None and filename is None and name == field_name and part_filename:
+                        # 只保留文件名部分，防止路径穿越
+                        filename = Path(part_filename).name
+                        _check_extension(filename, allowed_extensions)
+                        path = destination(filename)
+                        if path is None:
+                            buffer = bytearray()
+                        else:
+                            path.parent.mkdir(parents=True, exist_ok=True)
+                            out = await aiofiles.open(path, "wb")
+                elif event[0] == "data" and uploaded is None and filename is not None:
+                    data = event[1]
+                    size += len(data)
+                    if size > max_size:
+                        raise _too_large(max_size)
+                    digest.update(data)
+                    if out is not None:
+                        await out.write(data)
+                    else:
+                        buffer.extend(data)
+                elif event[0] == "end" and uploaded is None and filename is not None:
+                    if out is not None:
+                        await out.close()
+                        out = None
+                    uploaded = UploadedFile(
+                        filename, path, size, digest.hexdigest(),
+                        content=bytes(buffer) if buffer is not None else None
+                    )
+        parser.finalize()
+    except BaseException as e:
+        if out is not None:
+            await out.close()
+        if path is not None:
+            path.unlink(missing_ok=True)
+        if isinstance(e, FormParserError):
+            raise HTTPException(status_code=400, detail="Invalid multipart data")
+        raise
+
+    if uploaded is None:
+        raise HTTPException(status_code=400, detail=f"Missing file field: {field_name}")
+    return uploaded
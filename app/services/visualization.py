@@ -0,0 +1,122 @@
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+from app.services.detections import Detections
+from app.services.metrics import stage_timer
+from app.services.upload import write_bytes
+
+# 可视化模式：none 只返回检测框（由客户端绘制），thumbnail 返回缩略图，full 返回原尺寸图像
+VISUALIZATION_MODES = ("none", "thumbnail", "full")
+
+
+def normalize_mode(mode: Optional[str]) -> str:
+    """校验可视化模式，未指定时使用配置的默认值"""
+    if mode is None or mode == "":
+        mode = settings.VISUALIZATION_MODE
+    mode = mode.lower()
+    if mode not in VISUALIZATION_MODES:
+        raise ValueError(
+            f"Invalid visualization mode: {mode}. "
+            f"Supported modes: {', '.join(VISUALIZATION_MODES)}"
+        )
+    return mode
+
+
+def render_visualization(result, mode: str) -> Optional[bytes]:
+    """按模式绘制检测结果并编码为JPEG字节，none模式直接返回None（跳过绘图和编码）"""
+    if mode == "none":
+        return None
+    with stage_timer("plot"):
+        img = result.plot()
+    return _encode(img, mode)
+
+
+def render_detections(
+    frame: np.ndarray,
+    detections: Detections,
+    mode: str,
+    track_ids: Optional[List[int]] = None
+) -> Optional[bytes]:
+    """在原始帧上绘制列式检测结果（如跟踪器沿用的检测框）并编码为JPEG字节"""
+    if mode == "none":
+        return None
+    with stage_timer("plot"):
+        img = draw_detections(frame, detections, track_ids)
+    return _encode(img, mode)
+
+
+def draw_detections(frame: np.ndarray, detections: Detections, track_ids: Optional[List[int]] = None) -> np.ndarray:
+    """在原始帧的副本上绘制列式检测结果"""
+    img = frame.copy()
+    track_ids = track_ids or [None] * len(detections)
+    for (x1, y1, x2, y2), conf, cls, track_id in zip(
+        detections.xyxy.astype(int).tolist(), detections.conf.tolist(), detections.cls.tolist(), track_ids
+    ):
+        # 类别0（抬头）为绿色，其他为红色
+        color = (0, 255, 0) if cls == 0 else (0, 0, 255)
+        label = f'{detections.names.get(cls, cls)} {conf:.2f}'
+        if track_id is not None:
+            label = f'#{track_id} {label}'
+        cv2.rectangle(img, (x1, y1), (x2, y2), color, 2)
+        cv2.putText(img, label, (x1, max(y1 - 10, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+    return img
+
+
+def _encode(img: np.ndarray, mode: str) -> Optional[bytes]:
+    """thumbnail模式先缩小，再编码为JPEG字节"""
+    with stage_timer("encode"):
+        if mode == "thumbnail":
+            height, width = img.shape[:2]
+            target_width = settings.VISUALIZATION_THUMBNAIL_WIDTH
+            if width > target_width:
+                target_height = max(1, round(height * target_width / width))
+                img = cv2.resize(img, (target_width, target_height), interpolation=cv2.INTER_AREA)
+
+        ok, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, settings.VISUALIZATION_JPEG_QUALITY])
+    if not ok:
+        return None
+    return buffer.tobytes()
+
+
+def upload_url(path: Path) -> str:
+    """上传目录下文件对应的静态访问地址"""
+    return "/uploads/" + path.relative_to(settings.UPLOAD_DIR).as_posix()
+
+
+async def save_visualization(data: bytes, path: Path) -> str:
+    """异步写入可视化图像，返回其静态访问地址"""
+    await write_bytes(path, data)
+    return upload_url(path)
+
+
+def visualization_name(cache_key: str, result: Dict[str, Any]) -> str:
+    """可视化图像按缓存键命名，缓存结果中的地址始终指向对应内容的图像
+
+    负载过高降级得到的结果附加实际输入尺寸，不覆盖全尺寸结果的图像。
+    """
+    imgsz = result.get("effective_imgsz")
+    if imgsz is None or imgsz == settings.INFERENCE_IMGSZ:
+        return cache_key
+    return f"{cache_key}_{imgsz}"
+
+
+async def store_visualizations(result: Dict[str, Any], directory: Path, name: str) -> Dict[str, Any]:
+    """把处理结果中的可视化图像字节写入上传目录，替换为 visualization_url
+
+    HTTP接口不在JSON中内嵌base64图像，客户端按需单独下载二进制图像。
+    """
+    data = result.pop('visualization', None)
+    if data:
+        result['visualization_url'] = await save_visualization(data, directory / f"{name}.jpg")
+
+    for frame_result in result.get('results', []):
+        data = frame_result.pop('visualization', None)
+        if data:
+            frame_result['visualization_url'] = await save_visualization(
+                data, directory / name / f"frame_{frame_result['frame_number']}.jpg"
+            )
+    return result
@@ -1,182 +1,77 @@
+import logging
 import torch
 import numpy as np
 import cv2
 from app.core.config import settings
-from typing import Dict, List, Union, Any
+from app.services.detections import Detections
+from app.services.inference_backend import yolo5_model_path
+from app.services.visualization import draw_detections
+from app.services.yolo_service_new import YOLO8Service
+from typing import List, Optional, Any
 from pathlib import Path
-from datetime import datetime
 
-class YOLO5Service:
-    def __init__(self):
-        self.model = None
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.is_initialized = False
+logger = logging.getLogger(__name__)
+
 
-    async def initialize(self):
-        """初始化YOLO模型"""
-        print("初始化YOLO模型")
-        if not self.is_initialized:
-            try:
-                print(f"加载模型，路径: {settings.YOLO5_MODEL_PATH}")
-                print(f"使用设备: {self.device}")
-                self.model = torch.hub.load('ultralytics/yolov5', 'custom',
-                                          path=settings.YOLO5_MODEL_PATH,
-                                          device=self.device)
-                print("模型加载成功!")
-                self.model.conf = settings.CONFIDENCE_THRESHOLD
-                self.model.iou = settings.IOU_THRESHOLD
-                self.is_initialized = True
-                print("模型参数设置完成")
-            except Exception as e:
-                import traceback
-                traceback.print_exc()
-                print(f"模型加载失败: {str(e)}")
-                self.model = None
-                self.is_initialized = False
-                raise Exception(f"Failed to load YOLO5 model: {str(e)}")
-        return self.is_initialized
+class _YOLO5Result:
+    """YOLOv5单张图片的检测结果，提供与ultralytics Results相同的 names 和 plot() 接口"""
 
-    async def process_image(self, image_path: Union[str, Path]) -> Dict:
-        """处理单张图片"""
-        print("处理单张图片")
-        if not self.is_initialized:
-            await self.initialize()
-        
-        try:
-            # 读取图片
-            if isinstance(image_path, str):
-                image_path = Path(image_path)
-            
-            # 进行目标检测
-            results = self.model(str(image_path))
-            
-            # 解析检测结果
-            detections = self._parse_results(results)
-            head_up_rate = self._calculate_head_up_rate(detections)
-            
-            return {
-                'status': 'success',
-                'detections': detections,
-                'head_up_rate': head_up_rate,
-                'image_path': str(image_path)
-            }
-            
-        except Exception as e:
-            return {
-                'status': 'error',
-                'message': str(e),
-                'image_path': str(image_path)
-            }
+    def __init__(self, image: np.ndarray, pred: np.ndarray, names):
+        self.orig_img = image
+        self.pred = pred  # (N, 6): x1, y1, x2, y2, conf, cls
+        self.names = names
 
-    async def process_video(self, video_path: Union[str, Path]) -> Dict:
-        """处理视频文件"""
-        print("处理视频文件")
-        if not self.is_initialized:
-            await self.initialize()
-        
-        try:
-            cap = cv2.VideoCapture(str(video_path))
-            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            fps = int(cap.get(cv2.CAP_PROP_FPS))
-            
-            results = []
-            frame_number = 0
-            total_head_up_rate = 0
-            
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                    
-                # 每秒处理一帧
-                if frame_number % fps == 0:
-                    # 处理帧
-                    detection_result = await self.process_frame(frame)
-                    results.append({
-                        'frame_number': frame_number,
-                        'timestamp': frame_number / fps,
-                        'detections': detection_result['detections'],
-                        'head_up_rate': detection_result['head_up_rate']
-                    })
-                    total_head_up_rate += detection_result['head_up_rate']
-                
-                frame_number += 1
-            
-            cap.release()
-            
-            # 计算平均抬头率
-            avg_head_up_rate = total_head_up_rate / len(results) if results else 0
-            
-            return {
-                'status': 'success',
-                'video_info': {
-                    'total_frames': frame_count,
-                    'fps': fps,
-                    'duration': frame_count / fps
-                },
-                'results': results,
-                'average_head_up_rate': avg_head_up_rate
-            }
-            
-        except Exception as e:
-            return {
-                'status': 'error',
-                'message': str(e),
-                'video_path': str(video_path)
-            }
+    def plot(self) -> np.ndarray:
+        return draw_detections(self.orig_img, Detections.from_data(self.pred, self.names))
 
-    async def process_frame(self, frame: np.ndarray) -> Dict:
-        """处理单个视频帧"""
-        print("处理单个视频帧")
 
-        if not self.is_initialized or self.model is None:
-            print("模型未初始化，尝试初始化")
-            await self.initialize()
-            if self.model is None:
-                raise Exception("模型初始化失败，无法处理视频帧")
+class YOLO5Service(YOLO8Service):
+    """YOLOv5模型服务：通过torch.hub加载模型，图片/视频/批处理流程与YOLOv8服务相同"""
+    MODEL_NAME = "YOLOv5"
+
+    def __init__(self, model_path: Optional[str] = None, version: Optional[str] = None):
+        super().__init__(model_path or settings.YOLO5_MODEL_PATH, version)
+        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
+    def _load_model(self) -> bool:
+        """同步加载YOLO模型（在推理执行器中运行）"""
+        if self.is_initialized:
+            return True
+        logger.info("加载模型，路径: %s，后端: %s，设备: %s", self.model_path, settings.INFERENCE_BACKEND, self.device)
+        # yolov5的custom模型按文件类型选择运行时（.pt/.onnx/_openvino_model）
+        self.model = torch.hub.load('ultralytics/yolov5', 'custom',
+                                  path=yolo5_model_path(self.model_path),
+                                  device=self.device)
+        self.model.conf = settings.CONFIDENCE_THRESHOLD
+        self.model.iou = settings.IOU_THRESHOLD
+        self.is_initialized = True
+        logger.info("模型加载成功")
+        return True
 
+    def _predict(self, source: Any, imgsz: Optional[int] = None) -> List[_YOLO5Result]:
+        """调用模型推理，source为图片路径、BGR数组或它们的列表，每张图片返回一个结果"""
+        sources = source if isinstance(source, list) else [source]
+        images = []
+        for item in sources:
+            if isinstance(item, (str, Path)):
+                image = cv2.imread(str(item))
+                if image is None:
+                    raise ValueError(f"Cannot read image: {item}")
+                item = image
+            images.append(item)
 
-        try:
-            print("视频帧-初始化模型")
-            results = self.model(frame)
-            print("视频帧-解析结果")
-            detections = self._parse_results(results)
-            print("视频帧-计算抬头率")
-            head_up_rate = self._calculate_head_up_rate(detections)
-            
-            return {
-                'detections': detections,
-                'head_up_rate': head_up_rate,
-                'timestamp': datetime.now().timestamp()
-            }
-            
-        except Exception as e:
-            raise Exception(f"Error processing frame: {str(e)}")
+        # YOLOv5的AutoShape对numpy输入按RGB处理
+        with self._model_lock:
+            results = self.model([image[..., ::-1] for image in images], size=imgsz or settings.INFERENCE_IMGSZ)
+        return [
+            _YOLO5Result(image, pred.cpu().numpy(), results.names)
+            for image, pred in zip(images, results.xyxy)
+        ]
 
-    def _parse_results(self, results) -> List[Dict]:
-        """解析YOLO5检测结果"""
-        detections = []
-        for pred in results.xyxy[0]:
-            x1, y1, x2, y2, conf, cls = pred.cpu().numpy()
-            detections.append({
-                'bbox': [float(x1), float(y1), float(x2), float(y2)],
-                'confidence': float(conf),
-                'class': int(cls),
-                'class_name': results.names[int(cls)]
-            })
-        return detections
+    def _parse_results(self, result: _YOLO5Result) -> Detections:
+        """解析YOLO5检测结果（已是 (N, 6) 数组）"""
+        return Detections.from_data(result.pred, result.names)
 
-    def _calculate_head_up_rate(self, detections: List[Dict]) -> float:
-        """计算抬头率"""
-        if not detections:
-            return 0.0
-        
-        # 假设类别0表示"抬头"，类别1表示"低头"
-        head_up_count = sum(1 for det in detections if det['class'] == 0)
-        total_count = len(detections)
-        
-        return head_up_count / total_count if total_count > 0 else 0.0
 
 # 创建服务实例
 yolo_service = YOLO5Service()
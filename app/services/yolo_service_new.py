@@ -1,141 +1,409 @@
+import asyncio
+import logging
 import numpy as np
 import cv2
-import base64
+import threading
 from app.core.config import settings
-from typing import Dict, List, Union, Any
+from app.services.inference_executor import InferenceExecutor, inference_executor, segment_executor
+from app.services.batch_scheduler import create_batch_scheduler
+from app.services.visualization import normalize_mode, render_visualization
+from app.services.detections import Detections
+from app.services.frame_diff import MotionGate
+from app.services.inference_backend import backend_tag, prepare_yolo8_model
+from app.services.adaptive_quality import quality_controller
+from app.services.frame_sampler import SamplingPolicy, iter_frames, resolve_fps
+from app.services.metrics import stage_timer
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union, Any
 from pathlib import Path
 from datetime import datetime
 from ultralytics import YOLO  # 导入YOLOv8
 
+logger = logging.getLogger(__name__)
+
 class YOLO8Service:
-    def __init__(self):
+    MODEL_NAME = "YOLOv8"
+
+    def __init__(self, model_path: Optional[str] = None, version: Optional[str] = None):
+        # 权重路径和版本标识，默认取配置（模型注册表可以用不同的权重创建多个实例）
+        self.model_path = model_path or settings.YOLO8_MODEL_PATH
+        if version is None and self.model_path == settings.YOLO8_MODEL_PATH:
+            version = settings.YOLO8_MODEL_VERSION
+        self.version = version or ""
         self.model = None
         self.is_initialized = False
+        self.is_warmed_up = False
+        self.load_error: Optional[str] = None
+        self._init_lock = asyncio.Lock()
+        self._model_lock = threading.Lock()
+        self._batch_scheduler = create_batch_scheduler(self._process_batch)
 
     async def initialize(self):
-        """初始化YOLOv8模型"""
-        print("初始化YOLOv8模型")
-        if not self.is_initialized:
-            try:
-                print(f"加载模型，路径: {settings.YOLO8_MODEL_PATH}")  # 仍使用相同的配置路径
-                
-                # YOLOv8的初始化方式更简单
-                self.model = YOLO(settings.YOLO8_MODEL_PATH)
-                print("模型加载成功!")
-                
-                # 设置置信度和IOU阈值
-                self.model.conf = settings.CONFIDENCE_THRESHOLD
-                self.model.iou = settings.IOU_THRESHOLD
-                self.is_initialized = True
-                print("模型参数设置完成")
-            except Exception as e:
-                import traceback
-                traceback.print_exc()
-                print(f"模型加载失败: {str(e)}")
-                self.model = None
-                self.is_initialized = False
-                raise Exception(f"Failed to load YOLOv8 model: {str(e)}")
+        """初始化模型（加锁，避免并发的首次请求重复加载权重）"""
+        logger.debug("初始化%s模型", self.MODEL_NAME)
+        async with self._init_lock:
+            if not self.is_initialized:
+                try:
+                    if inference_executor.is_process:
+                        # 进程池模式下由工作进程各自加载并预热模型：进程池创建时每个进程启动即加载，
+                        # 之后切换的模型在各进程首次调用时加载；这里只验证加载和预热是否成功
+                        _evicted_keys.discard(self._worker_key)
+                        inference_executor.set_initializer(_worker_call, self._worker_key, "_load_model")
+                        await self._run_in_worker(inference_executor, "_load_model")
+                        self.is_initialized = True
+                    else:
+                        await inference_executor.run(self._load_model)
+                    self.load_error = None
+                except Exception as e:
+                    logger.exception("模型加载失败: %s", e)
+                    self.model = None
+                    self.is_initialized = False
+                    self.load_error = str(e)
+                    raise Exception(f"Failed to load {self.MODEL_NAME} model: {str(e)}")
         return self.is_initialized
 
-    async def process_image(self, image_path: Union[str, Path]) -> Dict:
-        """处理单张图片"""
-        print("处理单张图片")
+    async def warmup(self):
+        """预热模型：用空白图像在所有配置的输入尺寸上各推理一次，消除首个请求的冷启动开销"""
+        await self.initialize()
+        if not inference_executor.is_process:
+            await inference_executor.run(self._warmup_sync, *self._warmup_args())
+        # 进程池模式下工作进程在加载模型时各自预热（见_worker_call），initialize中已在一个进程内完成；
+        # 视频分段进程池按需创建，每个进程启动时加载并预热当前模型
+        if segment_executor.max_workers > 1:
+            segment_executor.set_initializer(_worker_call, self._worker_key, "_load_model")
+        self.is_warmed_up = True
+        logger.info("%s模型预热完成", self.MODEL_NAME)
+
+    @staticmethod
+    def _warmup_args() -> Tuple[List[int], List[int]]:
+        """预热使用的（图像尺寸, 推理输入尺寸）：开启自适应质量时每个可能用到的输入尺寸都预热一次"""
+        imgszs = quality_controller.sizes if quality_controller.enabled else [settings.INFERENCE_IMGSZ]
+        return list(settings.YOLO8_WARMUP_SIZES), list(imgszs)
+
+    @property
+    def model_version(self) -> str:
+        """模型版本标识（用于结果缓存键），未配置时由权重文件的大小和修改时间生成，并附带推理后端"""
+        if self.version:
+            return f"{self.version}:{backend_tag()}"
+        path = Path(self.model_path)
+        try:
+            stat = path.stat()
+        except OSError:
+            return f"{path.name}:{backend_tag()}"
+        return f"{path.name}:{stat.st_size}:{int(stat.st_mtime)}:{backend_tag()}"
+
+    @property
+    def _worker_key(self) -> Tuple[type, str, str]:
+        """进程池工作进程中对应服务实例的标识（类、权重路径、版本）"""
+        return type(self), self.model_path, self.version
+
+    @property
+    def is_ready(self) -> bool:
+        """模型已加载并预热，可以接收流量"""
+        return self.is_initialized and self.is_warmed_up
+
+    def _load_model(self) -> bool:
+        """同步加载模型（在推理执行器中运行）"""
+        if self.is_initialized:
+            return True
+        logger.info("加载模型，路径: %s，后端: %s", self.model_path, backend_tag())
+
+        # YOLOv8的初始化方式更简单，ONNX/OpenVINO模型由ultralytics按文件类型选择运行时
+        self.model = YOLO(prepare_yolo8_model(self.model_path), task="detect")
+
+        # 设置置信度和IOU阈值
+        self.model.conf = settings.CONFIDENCE_THRESHOLD
+        self.model.iou = settings.IOU_THRESHOLD
+        self.is_initialized = True
+        logger.info("模型加载成功")
+        return True
+
+    def _warmup_sync(self, sizes: List[int], imgszs: Optional[List[int]] = None) -> bool:
+        """同步预热（在推理执行器中运行）"""
+        for size in sizes:
+            dummy = np.zeros((size, size, 3), dtype=np.uint8)
+            for imgsz in imgszs or [settings.INFERENCE_IMGSZ]:
+                self._predict(dummy, imgsz)
+            logger.debug("模型预热完成: %sx%s", size, size)
+        return True
+
+    async def shutdown(self):
+        """停止批调度器"""
+        if self._batch_scheduler is not None:
+            await self._batch_scheduler.stop()
+
+    async def _run(self, method_name: str, *args: Any) -> Any:
+        """通过推理执行器调用同步处理方法，事件循环只负责I/O"""
+        if inference_executor.is_process:
+            return await self._run_in_worker(inference_executor, method_name, *args)
+        return await inference_executor.run(getattr(self, method_name), *args)
+
+    async def _run_in_worker(self, executor: InferenceExecutor, method_name: str, *args: Any) -> Any:
+        """在进程池工作进程中调用本模型服务实例的同步方法，同时让该进程释放已卸载的模型"""
+        return await executor.run(
+            _worker_call, self._worker_key, method_name, *args, evict=tuple(_evicted_keys)
+        )
+
+    def release(self, evict_workers: bool = True):
+        """释放模型占用的内存（卸载时调用）
+
+        进程池工作进程中的模型实例在各进程处理下一个任务时释放；
+        其他已注册的服务与本服务使用同一权重和版本时应传入evict_workers=False。
+        """
+        self.model = None
+        self.is_initialized = False
+        self.is_warmed_up = False
+        if evict_workers:
+            _evicted_keys.add(self._worker_key)
+
+    def _predict(self, source: Any, imgsz: Optional[int] = None):
+        """调用模型推理（ultralytics的predictor不是线程安全的，需要加锁），imgsz为推理输入尺寸"""
+        imgsz = imgsz or settings.INFERENCE_IMGSZ
+        with self._model_lock:
+            # 关闭ultralytics逐次推理的控制台输出，耗时由stage_timer记录到指标，调试时写入DEBUG日志
+            results = self.model(source, imgsz=imgsz, verbose=False)
+        if results and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("推理完成: %d张，输入尺寸%s，耗时(ms) %s", len(results), imgsz, results[0].speed)
+        return results
+
+    async def process_image(
+        self,
+        image: Union[str, Path, np.ndarray, bytes],
+        visualization: Optional[str] = None,
+        image_path: Optional[Union[str, Path]] = None
+    ) -> Dict:
+        """处理单张图片
+
+        image可以是图片路径、已解码的BGR数组或未解码的图片字节（在推理执行器中解码，不经过磁盘）；
+        image_path为结果中记录的图片路径，默认取image本身的路径。
+        visualization为可视化模式（none/thumbnail/full），visualization字段为JPEG字节。
+        """
+        logger.debug("处理单张图片")
         if not self.is_initialized:
             await self.initialize()
-        
+
+        if image_path is None and isinstance(image, (str, Path)):
+            image_path = image
+        # 负载过高时降低输入尺寸、关闭可视化，实际使用的尺寸记录在effective_imgsz中
+        imgsz, visualization = quality_controller.select(normalize_mode(visualization))
+        async with quality_controller.track():
+            return await self._run(
+                "_process_image_sync", image, visualization,
+                str(image_path) if image_path is not None else None, imgsz
+            )
+
+    def _process_image_sync(
+        self,
+        image: Union[str, Path, np.ndarray, bytes],
+        visualization: str,
+        image_path: Optional[str] = None,
+        imgsz: Optional[int] = None
+    ) -> Dict:
+        """处理单张图片（同步实现，在推理执行器中运行）"""
         try:
             # 读取图片
-            if isinstance(image_path, str):
-                image_path = Path(image_path)
-            
+            if isinstance(image, (bytes, bytearray, memoryview)):
+                image = _decode_image(image)
+                if image is None:
+                    raise ValueError("Cannot decode image")
+            elif isinstance(image, Path):
+                image = str(image)
+
             # 使用YOLOv8进行目标检测
-            results = self.model(str(image_path))
+            imgsz = imgsz or settings.INFERENCE_IMGSZ
+            with stage_timer("inference"):
+                results = self._predict(image, imgsz)
             
             # 解析检测结果
-            detections = self._parse_results(results[0])
-            head_up_rate = self._calculate_head_up_rate(detections)
-            
-            # 生成可视化图像
-            visualized_img = results[0].plot()
-            
-            # 将图像编码为base64字符串
-            _, buffer = cv2.imencode('.jpg', visualized_img)
-            img_str = base64.b64encode(buffer).decode('utf-8')
+            with stage_timer("parse"):
+                detections = self._parse_results(results[0])
+                head_up_rate = self._calculate_head_up_rate(detections)
             
             return {
                 'status': 'success',
-                'detections': detections,
+                'detections': detections.serialize(),
                 'head_up_rate': head_up_rate,
-                'image_path': str(image_path),
-                'visualization': img_str  # 添加可视化图像
+                'image_path': image_path,
+                'effective_imgsz': imgsz,  # 实际使用的推理输入尺寸
+                'visualization': render_visualization(results[0], visualization)  # 可视化图像
             }
             
         except Exception as e:
             return {
                 'status': 'error',
                 'message': str(e),
-                'image_path': str(image_path)
+                'image_path': image_path
+            }
+
+    async def process_video(
+        self,
+        video_path: Union[str, Path],
+        visualization: Optional[str] = None,
+        progress: Optional[Callable[[int, int], None]] = None,
+        sampling: Optional[SamplingPolicy] = None
+    ) -> Dict:
+        """处理视频文件
+
+        visualization为采样帧的可视化模式；sampling为采样策略（默认取配置）；
+        progress(已处理帧数, 总帧数)用于上报进度，在事件循环中调用。
+        """
+        logger.debug("处理视频文件: %s", video_path)
+        if not self.is_initialized:
+            await self.initialize()
+
+        visualization = normalize_mode(visualization)
+        sampling = sampling or SamplingPolicy.from_params()
+        if segment_executor.max_workers > 1:
+            return await self._process_video_segmented(video_path, visualization, sampling, progress)
+        return await self._process_video_sequential(video_path, visualization, sampling, progress)
+
+    async def _process_video_sequential(
+        self,
+        video_path: Union[str, Path],
+        visualization: str,
+        sampling: SamplingPolicy,
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> Dict:
+        """顺序处理视频：与 iter_video 相同，每个采样帧单独提交到推理执行器
+
+        帧之间会释放执行器，长视频任务不会一直占用工作线程/进程，实时流和图片请求可以穿插执行。
+        """
+        try:
+            results = []
+            async for record in self.iter_video(video_path, visualization, sampling):
+                if record['type'] == 'info':
+                    video_info = record['video_info']
+                elif record['type'] == 'frame':
+                    del record['type']
+                    results.append(record)
+                    if progress is not None:
+                        progress(record['frame_number'] + 1, video_info['total_frames'])
+
+            return self._summarize_video(results, video_info['total_frames'], video_info['fps'])
+
+        except Exception as e:
+            return {
+                'status': 'error',
+                'message': str(e),
+                'video_path': str(video_path)
             }
 
-    async def process_video(self, video_path: Union[str, Path]) -> Dict:
-        """处理视频文件"""
-        print("处理视频文件")
+    async def iter_video(
+        self,
+        video_path: Union[str, Path],
+        visualization: Optional[str] = None,
+        sampling: Optional[SamplingPolicy] = None
+    ) -> AsyncIterator[Dict]:
+        """流式处理视频
+
+        依次产出 info（视频信息）、每个采样帧的 frame 结果（计算完成后立即产出）
+        和最后的 summary 汇总记录。只保留累计统计量，内存占用与视频长度无关；
+        解码下一帧与当前帧的推理并行进行。
+        """
+        logger.debug("流式处理视频文件: %s", video_path)
         if not self.is_initialized:
             await self.initialize()
-        
+
+        visualization = normalize_mode(visualization)
+        sampling = sampling or SamplingPolicy.from_params()
+
+        cap = await asyncio.to_thread(cv2.VideoCapture, str(video_path))
+        pending = None
         try:
-            cap = cv2.VideoCapture(str(video_path))
+            if not cap.isOpened():
+                raise Exception(f"Cannot open video: {video_path}")
             frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            fps = int(cap.get(cv2.CAP_PROP_FPS))
-            
-            results = []
-            frame_number = 0
+            fps = resolve_fps(cap)
+            video_info = _video_info(frame_count, fps)
+            yield {'type': 'info', 'video_info': video_info}
+
+            frames = iter_frames(cap, sampling.frame_numbers(frame_count, fps))
+            gate = MotionGate() if settings.MOTION_GATE_ENABLED else None
+            processed = 0
             total_head_up_rate = 0
-            
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
+
+            loop = asyncio.get_running_loop()
+
+            def detect(frame: np.ndarray) -> Dict:
+                # 在门控线程中调用：推理仍提交到推理执行器，等待其结果
+                return asyncio.run_coroutine_threadsafe(
+                    self._run("_process_frame_sync", frame, visualization), loop
+                ).result()
+
+            pending = asyncio.ensure_future(asyncio.to_thread(next, frames, None))
+            while True:
+                item = await pending
+                pending = None
+                if item is None:
                     break
-                    
-                # 每秒处理一帧
-                if frame_number % fps == 0:
-                    # 处理帧
-                    detection_result = await self.process_frame(frame)
-                    
-                    # 添加到结果列表
-                    frame_result = {
-                        'frame_number': frame_number,
-                        'timestamp': frame_number / fps,
-                        'detections': detection_result['detections'],
-                        'head_up_rate': detection_result['head_up_rate']
-                    }
-                    
-                    print("visualization:", detection_result.get('visualization', None))
-                    # 如果有可视化，也添加
-                    if 'visualization' in detection_result:
-                        frame_result['visualization'] = detection_result['visualization']
-                        
-                    results.append(frame_result)
-                    total_head_up_rate += detection_result['head_up_rate']
-                
-                frame_number += 1
-            
-            cap.release()
-            
-            # 计算平均抬头率
-            avg_head_up_rate = total_head_up_rate / len(results) if results else 0
-            
-            return {
+                # 预取下一帧的解码，与当前帧的推理重叠
+                pending = asyncio.ensure_future(asyncio.to_thread(next, frames, None))
+
+                frame_number, frame = item
+                # 帧差比较（缩小全尺寸帧）在线程中进行，不占用事件循环
+                detection_result = await asyncio.to_thread(_gated_detect, gate, frame, detect)
+                processed += 1
+                total_head_up_rate += detection_result['head_up_rate']
+                yield {'type': 'frame', **_frame_record(frame_number, fps, detection_result)}
+
+            yield {
+                'type': 'summary',
                 'status': 'success',
-                'video_info': {
-                    'total_frames': frame_count,
-                    'fps': fps,
-                    'duration': frame_count / fps
-                },
-                'results': results,
-                'average_head_up_rate': avg_head_up_rate
+                'video_info': video_info,
+                'sampled_frames': processed,
+                'average_head_up_rate': total_head_up_rate / processed if processed else 0
             }
-            
+        finally:
+            # 等待进行中的解码结束后再释放VideoCapture
+            if pending is not None:
+                await asyncio.gather(pending, return_exceptions=True)
+            await asyncio.to_thread(cap.release)
+
+    async def _process_video_segmented(
+        self,
+        video_path: Union[str, Path],
+        visualization: str,
+        sampling: SamplingPolicy,
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> Dict:
+        """把视频按帧区间切分为多段，由多个工作进程各自打开视频、seek到所在区间并行推理，
+        最后按帧号合并为与顺序处理相同的结果格式"""
+        try:
+            frame_count, fps = await asyncio.to_thread(_probe_video, str(video_path))
+            if frame_count <= 0:
+                # 总帧数未知时无法切分，退回顺序处理
+                return await self._process_video_sequential(video_path, visualization, sampling, progress)
+
+            frame_numbers = list(sampling.frame_numbers(frame_count, fps))
+            segments = [
+                segment.tolist()
+                for segment in np.array_split(np.array(frame_numbers, dtype=int),
+                                              min(segment_executor.max_workers, len(frame_numbers)))
+                if len(segment)
+            ]
+
+            # 每段覆盖的帧数（用于累计进度）：从上一段末尾之后到本段最后一个采样帧
+            bounds = [0] + [segment[-1] + 1 for segment in segments[:-1]] + [frame_count]
+            spans = [bounds[i + 1] - bounds[i] for i in range(len(segments))]
+
+            async def run_segment(index: int) -> Tuple[int, List[Dict]]:
+                segment_results = await self._run_in_worker(
+                    segment_executor, "_process_segment_sync",
+                    str(video_path), segments[index], fps, visualization
+                )
+                return index, segment_results
+
+            results = []
+            frames_done = 0
+            for completed in asyncio.as_completed([run_segment(i) for i in range(len(segments))]):
+                index, segment_results = await completed
+                results.extend(segment_results)
+                frames_done += spans[index]
+                if progress is not None:
+                    progress(frames_done, frame_count)
+
+            results.sort(key=lambda frame_result: frame_result['frame_number'])
+            return self._summarize_video(results, frame_count, fps)
+
         except Exception as e:
             return {
                 'status': 'error',
@@ -143,75 +411,139 @@ class YOLO8Service:
                 'video_path': str(video_path)
             }
 
-    async def process_frame(self, frame: np.ndarray) -> Dict:
-        """处理单个视频帧"""
-        print("处理单个视频帧")
+    def _process_segment_sync(
+        self,
+        video_path: str,
+        frame_numbers: List[int],
+        fps: float,
+        visualization: str
+    ) -> List[Dict]:
+        """处理视频的一个分段（在分段工作进程中运行，使用独立的VideoCapture）"""
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise Exception(f"Cannot open video: {video_path}")
+        try:
+            return list(self._iter_video_results(cap, frame_numbers, fps, visualization))
+        finally:
+            cap.release()
+
+    def _iter_video_results(
+        self,
+        cap: cv2.VideoCapture,
+        frame_numbers: Iterable[int],
+        fps: float,
+        visualization: str
+    ) -> Iterator[Dict]:
+        """逐个产出采样帧的检测结果，只解码采样到的帧，其余帧通过grab()/seek跳过
 
-        if not self.is_initialized or self.model is None:
-            print("模型未初始化，尝试初始化")
+        开启帧差门控时，画面与上一次推理的帧几乎相同的采样帧直接复用其结果（cached=True）。
+        """
+        gate = MotionGate() if settings.MOTION_GATE_ENABLED else None
+        for frame_number, frame in iter_frames(cap, frame_numbers):
+            detection_result = _gated_detect(
+                gate, frame, lambda frame: self._process_frame_sync(frame, visualization)
+            )
+            yield _frame_record(frame_number, fps, detection_result)
+
+    def _summarize_video(self, results: List[Dict], frame_count: int, fps: float) -> Dict:
+        """汇总采样帧结果"""
+        # 计算平均抬头率
+        total_head_up_rate = sum(frame_result['head_up_rate'] for frame_result in results)
+        avg_head_up_rate = total_head_up_rate / len(results) if results else 0
+        
+        return {
+            'status': 'success',
+            'video_info': _video_info(frame_count, fps),
+            'results': results,
+            'average_head_up_rate': avg_head_up_rate
+        }
+
+    async def process_frame(
+        self,
+        frame: Union[np.ndarray, bytes],
+        visualization: Optional[str] = None
+    ) -> Optional[Dict]:
+        """处理单个视频帧，visualization为可视化模式，visualization字段为JPEG字节或None
+
+        frame可以是已解码的BGR数组或未解码的图片字节（在推理执行器中解码），字节无法解码时返回None。
+        """
+        if not self.is_initialized:
+            logger.info("模型未初始化，尝试初始化")
             await self.initialize()
-            if self.model is None:
+            if not self.is_initialized:
                 raise Exception("模型初始化失败，无法处理视频帧")
 
+        # 负载过高时降低输入尺寸、关闭可视化，实际使用的尺寸记录在effective_imgsz中
+        imgsz, visualization = quality_controller.select(normalize_mode(visualization))
         try:
-            print("视频帧-开始处理")
-            # YOLOv8处理帧
-            results = self.model(frame)
-            
-            print("视频帧-解析结果")
-            detections = self._parse_results(results[0])
-            
-            print("视频帧-计算抬头率")
-            head_up_rate = self._calculate_head_up_rate(detections)
-            
-            # 生成可视化图像
-            visualized_img = results[0].plot()
-            
-            # 将图像编码为base64字符串
-            _, buffer = cv2.imencode('.jpg', visualized_img)
-            img_str = base64.b64encode(buffer).decode('utf-8')
-            
-            
-            return {
-                'detections': detections,
-                'head_up_rate': head_up_rate,
-                'timestamp': datetime.now().timestamp(),
-                'visualization': img_str  # 返回可视化结果
-            }
-            
+            async with quality_controller.track():
+                if self._batch_scheduler is not None:
+                    # 与其他并发会话的帧合并成一次批量推理
+                    return await self._batch_scheduler.submit((frame, visualization, imgsz))
+                return await self._run("_process_frame_sync", frame, visualization, imgsz)
         except Exception as e:
             raise Exception(f"Error processing frame: {str(e)}")
 
-    def _parse_results(self, result) -> List[Dict]:
-        """解析YOLOv8检测结果"""
-        detections = []
-        
-        # YOLOv8结果格式与YOLOv5不同
-        boxes = result.boxes
-        for i in range(len(boxes)):
-            box = boxes[i]
-            x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-            confidence = float(box.conf[0])
-            cls = int(box.cls[0])
-            
-            detections.append({
-                'bbox': [float(x1), float(y1), float(x2), float(y2)],
-                'confidence': confidence,
-                'class': cls,
-                'class_name': result.names[cls]
-            })
-        return detections
-
-    def _calculate_head_up_rate(self, detections: List[Dict]) -> float:
-        """计算抬头率"""
-        if not detections:
-            return 0.0
-        
-        # 假设类别0表示"抬头"，类别1表示"低头"
-        head_up_count = sum(1 for det in detections if det['class'] == 0)
-        total_count = len(detections)
+    async def _process_batch(self, items: List[Tuple[Union[np.ndarray, bytes], str, int]]) -> List[Optional[Dict]]:
+        """批调度器回调：在推理执行器中批量处理一组（帧, 可视化模式, 输入尺寸）"""
+        return await self._run("_process_batch_sync", items)
+
+    def _process_frame_sync(
+        self,
+        frame: Union[np.ndarray, bytes],
+        visualization: str,
+        imgsz: Optional[int] = None
+    ) -> Optional[Dict]:
+        """处理单个视频帧（同步实现，在推理执行器中运行），字节无法解码时返回None"""
+        if isinstance(frame, (bytes, bytearray, memoryview)):
+            frame = _decode_image(frame)
+            if frame is None:
+                return None
+        # YOLOv8处理帧
+        imgsz = imgsz or settings.INFERENCE_IMGSZ
+        with stage_timer("inference"):
+            results = self._predict(frame, imgsz)
+        return self._build_frame_result(results[0], visualization, imgsz)
+
+    def _process_batch_sync(self, items: List[Tuple[Union[np.ndarray, bytes], str, int]]) -> List[Optional[Dict]]:
+        """批量处理多个视频帧：输入尺寸相同的帧一次前向推理，逐帧解析结果（无法解码的帧结果为None）"""
+        logger.debug("视频帧批量处理: %d 帧", len(items))
+        frames = [
+            _decode_image(frame) if isinstance(frame, (bytes, bytearray, memoryview)) else frame
+            for frame, _, _ in items
+        ]
+        outputs: List[Optional[Dict]] = [None] * len(items)
+        for imgsz in dict.fromkeys(imgsz for _, _, imgsz in items):
+            indices = [i for i, item in enumerate(items) if item[2] == imgsz and frames[i] is not None]
+            if not indices:
+                continue
+            with stage_timer("inference"):
+                results = self._predict([frames[i] for i in indices], imgsz)
+            for i, result in zip(indices, results):
+                outputs[i] = self._build_frame_result(result, items[i][1], imgsz)
+        return outputs
+
+    def _build_frame_result(self, result, visualization: str, imgsz: Optional[int] = None) -> Dict:
+        """将单帧推理结果转换为接口返回格式"""
+        with stage_timer("parse"):
+            detections = self._parse_results(result)
+            head_up_rate = self._calculate_head_up_rate(detections)
         
-        return head_up_count / total_count if total_count > 0 else 0.0
+        return {
+            'detections': detections.serialize(),
+            'head_up_rate': head_up_rate,
+            'timestamp': datetime.now().timestamp(),
+            'effective_imgsz': imgsz or settings.INFERENCE_IMGSZ,  # 实际使用的推理输入尺寸
+            'visualization': render_visualization(result, visualization)  # 可视化图像的JPEG字节
+        }
+
+    def _parse_results(self, result) -> Detections:
+        """解析YOLOv8检测结果：一次性拷贝所有检测框，得到列式数组"""
+        return Detections.from_yolov8(result)
+
+    def _calculate_head_up_rate(self, detections: Detections) -> float:
+        """计算抬头率（向量化）"""
+        return detections.head_up_rate()
 
     def _visualize_results(self, image: np.ndarray, result) -> np.ndarray:
         """自定义可视化结果，与示例代码效果一致"""
@@ -238,5 +570,98 @@ class YOLO8Service:
             cv2.putText(img, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
         
         return img
+
+def _decode_image(data: Union[bytes, bytearray, memoryview]) -> Optional[np.ndarray]:
+    """解码图片字节为BGR数组，无法解码时返回None"""
+    with stage_timer("imdecode"):
+        return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def _video_info(frame_count: int, fps: float) -> Dict:
+    """视频信息（总帧数、帧率、时长）"""
+    return {
+        'total_frames': frame_count,
+        'fps': fps,
+        'duration': frame_count / fps
+    }
+
+
+def _gated_detect(
+    gate: Optional[MotionGate],
+    frame: np.ndarray,
+    detect: Callable[[np.ndarray], Dict]
+) -> Dict:
+    """帧差门控的一步：画面与上一次推理的帧几乎相同时复用其结果，否则调用detect推理并记录为新的基准"""
+    detection_result = gate.check(frame) if gate is not None else None
+    if detection_result is None:
+        detection_result = detect(frame)
+        if gate is not None:
+            gate.update(detection_result)
+    return detection_result
+
+
+def _frame_record(frame_number: int, fps: float, detection_result: Dict) -> Dict:
+    """把一个采样帧的检测结果整理为视频帧记录"""
+    frame_result = {
+        'frame_number': frame_number,
+        'timestamp': frame_number / fps,
+        'detections': detection_result['detections'],
+        'head_up_rate': detection_result['head_up_rate'],
+        'effective_imgsz': detection_result['effective_imgsz']
+    }
+    if 'cached' in detection_result:
+        frame_result['cached'] = detection_result['cached']
+    if detection_result['visualization'] is not None:
+        frame_result['visualization'] = detection_result['visualization']
+    return frame_result
+
+
+def _probe_video(video_path: str) -> Tuple[int, float]:
+    """读取视频的总帧数和帧率"""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            raise Exception(f"Cannot open video: {video_path}")
+        return int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), resolve_fps(cap)
+    finally:
+        cap.release()
+
+
+# 进程池模式下每个工作进程为每个模型持有独立的服务实例
+_worker_services: Dict[Tuple[type, str, str], YOLO8Service] = {}
+
+
+# 主进程中记录的已卸载模型，随每次调用传给工作进程释放
+_evicted_keys: Set[Tuple[type, str, str]] = set()
+
+# 工作进程中已预热的模型
+_worker_warmed: Set[Tuple[type, str, str]] = set()
+
+
+def _worker_call(
+    key: Tuple[type, str, str],
+    method_name: str,
+    *args: Any,
+    evict: Tuple[Tuple[type, str, str], ...] = ()
+) -> Any:
+    """进程池工作进程入口：按需加载并预热进程内模型（每个进程内每个模型只预热一次）后调用对应的同步方法
+
+    evict为已卸载的模型，先从本进程中释放。
+    """
+    for evicted in evict:
+        if evicted != key and _worker_services.pop(evicted, None) is not None:
+            _worker_warmed.discard(evicted)
+            logger.info("工作进程已释放模型: %s", evicted[1])
+    service = _worker_services.get(key)
+    if service is None:
+        service_class, model_path, version = key
+        service = _worker_services[key] = service_class(model_path, version)
+    service._load_model()
+    if key not in _worker_warmed:
+        service._warmup_sync(*service._warmup_args())
+        _worker_warmed.add(key)
+    return getattr(service, method_name)(*args)
+
+
 # 创建服务实例
-yolo_service = YOLO8Service()
\ No newline at end of file
+yolo_service = YOLO8Service()